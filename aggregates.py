@@ -0,0 +1,174 @@
+"""
+Precomputed aggregate tables for the BI queries in queries.md.
+
+The sales analyses (sales by month, online vs offline, store type revenue, sales in
+Germany, historical sales by month and year, and sales velocity by year) all scan
+orders_table and join it to the dimension tables. The aggregates here are built once
+after a load, so the dashboard queries read a few thousand pre-summed rows instead:
+
+- agg_sales_by_month: orders, units and revenue per (year, month, store_type, country_code)
+- agg_sale_intervals_by_year: sales, first and last sale, and the mean time between
+  consecutive sales per year. Consecutive gaps telescope, so their mean is
+  (last sale - first sale) / (sales - 1).
+
+A full refresh recomputes every row. An incremental refresh is given the date_uuids of
+newly loaded orders and only recomputes the years and months they fall in. Both run in
+one transaction, so readers see either the old or the new aggregates. Indexes on the
+join keys of the fact and dimension tables are created as well, so the incremental
+refreshes only read the orders of the affected periods.
+"""
+
+from collections import namedtuple
+
+import sqlalchemy
+
+import database_utils
+import schema
+
+AggregateTable = namedtuple("AggregateTable", ["name", "grain", "create", "query"])
+
+# price as a number, whether product_price is still stored as a '£' string or already numeric
+PRICE = "REPLACE(p.product_price::text, '£', '')::numeric"
+
+AGGREGATES = [
+    AggregateTable(
+        "agg_sales_by_month",
+        ("year", "month"),
+        """
+        CREATE TABLE IF NOT EXISTS agg_sales_by_month (
+            year integer NOT NULL,
+            month integer NOT NULL,
+            store_type text,
+            country_code text,
+            orders bigint NOT NULL,
+            units bigint NOT NULL,
+            revenue numeric NOT NULL
+        )
+        """,
+        f"""
+        SELECT d.year::int, d.month::int, s.store_type::text, s.country_code::text,
+               COUNT(*), SUM(o.product_quantity), SUM(o.product_quantity * {PRICE})
+        FROM orders_table AS o
+        JOIN dim_date_times AS d ON d.date_uuid = o.date_uuid
+        JOIN dim_stores AS s ON s.store_code = o.store_code
+        JOIN dim_products AS p ON p.product_code = o.product_code
+        WHERE {{periods}}
+        GROUP BY 1, 2, 3, 4
+        """,
+    ),
+    AggregateTable(
+        "agg_sale_intervals_by_year",
+        ("year",),
+        """
+        CREATE TABLE IF NOT EXISTS agg_sale_intervals_by_year (
+            year integer PRIMARY KEY,
+            sales bigint NOT NULL,
+            first_sale timestamp NOT NULL,
+            last_sale timestamp NOT NULL,
+            mean_interval interval
+        )
+        """,
+        """
+        SELECT d.year::int, COUNT(*), MIN(d.datetime), MAX(d.datetime),
+               (MAX(d.datetime) - MIN(d.datetime)) / NULLIF(COUNT(*) - 1, 0)
+        FROM orders_table AS o
+        JOIN dim_date_times AS d ON d.date_uuid = o.date_uuid
+        WHERE d.datetime IS NOT NULL AND {periods}
+        GROUP BY 1
+        """,
+    ),
+]
+
+# (table, columns) pairs indexed for the joins and the dashboard filters
+INDEXES = [
+    ("orders_table", ("date_uuid",)),
+    ("orders_table", ("store_code",)),
+    ("orders_table", ("product_code",)),
+    ("dim_date_times", ("date_uuid",)),
+    ("dim_date_times", ("year", "month")),
+    ("agg_sales_by_month", ("year", "month")),
+    ("agg_sales_by_month", ("country_code", "store_type")),
+]
+
+# pipelines whose tables the aggregates are computed from, and the tables
+SOURCES = ("order", "store", "product", "date_event")
+SOURCE_TABLES = ("orders_table", "dim_date_times", "dim_stores", "dim_products")
+
+
+def create_indexes(connection):
+    """Creates the INDEXES that do not exist yet."""
+    for table_name, columns in INDEXES:
+        connection.execute(
+            sqlalchemy.text(
+                f'CREATE INDEX IF NOT EXISTS "{schema.index_name(table_name, columns)}" '
+                f'ON "{table_name}" ({", ".join(columns)})'
+            )
+        )
+
+
+def refresh(engine=None, date_uuids=None):
+    """
+    Builds or refreshes the aggregate tables.
+
+    Args:
+        engine (sqlalchemy.engine.Engine, optional): Target database. Defaults to the LOCAL engine.
+        date_uuids (list of str, optional): date_uuids of the orders loaded since the last refresh.
+            Only the periods they fall in are recomputed. Defaults to None, which recomputes every row.
+
+    Returns:
+        dict: aggregate table name -> number of rows written, empty if a source table
+        has not been loaded yet
+    """
+    engine = engine or database_utils.DatabaseConnector().init_db_engine("LOCAL")
+    written = {}
+    with engine.begin() as connection:
+        inspector = sqlalchemy.inspect(connection)
+        if not all(inspector.has_table(table_name) for table_name in SOURCE_TABLES):
+            return written
+        incremental = date_uuids is not None
+        for aggregate in AGGREGATES:
+            incremental = incremental and inspector.has_table(aggregate.name)
+            connection.execute(sqlalchemy.text(aggregate.create))
+        create_indexes(connection)
+
+        if incremental:
+            # the uuids are cast to the column's type (UUID or text), so its index is used
+            uuid_type = next(
+                column["type"].compile(dialect=connection.dialect)
+                for column in inspector.get_columns("dim_date_times")
+                if column["name"] == "date_uuid"
+            )
+            connection.execute(
+                sqlalchemy.text(
+                    "CREATE TEMPORARY TABLE touched_periods ON COMMIT DROP AS "
+                    "SELECT DISTINCT year, month FROM dim_date_times "
+                    f"WHERE date_uuid = ANY(CAST(:date_uuids AS {uuid_type}[]))"
+                ),
+                {"date_uuids": [str(date_uuid) for date_uuid in date_uuids]},
+            )
+
+        for aggregate in AGGREGATES:
+            if incremental:
+                grain = ", ".join(aggregate.grain)
+                cast_grain = ", ".join(f"{column}::int" for column in aggregate.grain)
+                periods = (
+                    f"({', '.join(f'd.{column}' for column in aggregate.grain)}) "
+                    f"IN (SELECT {grain} FROM touched_periods)"
+                )
+                connection.execute(
+                    sqlalchemy.text(
+                        f"DELETE FROM {aggregate.name} WHERE ({grain}) "
+                        f"IN (SELECT {cast_grain} FROM touched_periods)"
+                    )
+                )
+            else:
+                periods = "TRUE"
+                connection.execute(sqlalchemy.text(f"DELETE FROM {aggregate.name}"))
+            result = connection.execute(
+                sqlalchemy.text(
+                    f"INSERT INTO {aggregate.name} "
+                    + aggregate.query.format(periods=periods)
+                )
+            )
+            written[aggregate.name] = result.rowcount
+    return written
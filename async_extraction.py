@@ -0,0 +1,309 @@
+"""
+Asynchronous facade over the DataExtractor sources.
+
+AsyncDataExtractor offers every source as a coroutine, so an orchestrator can overlap
+their network latency in one event loop. The store API and date_details.json are fetched
+with one shared aiohttp session. The blocking sources (RDS through SQLAlchemy, S3 through
+boto3 and the card PDF through tabula) run in a thread pool. Every HTTP request and
+every blocking call counts against one global concurrency limit and one global rate
+limit.
+
+Usage:
+    async with AsyncDataExtractor(max_concurrency=16, rate_limit=50) as extractor:
+        frames, errors = await extractor.extract_all()
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import pandas as pd
+
+import config
+import metrics
+from data_extraction import DataExtractor
+
+STORE_DETAILS_URL = "https://aqj7u5id95.execute-api.eu-west-1.amazonaws.com/prod/store_details/{store_number}"
+NUMBER_OF_STORES_URL = (
+    "https://aqj7u5id95.execute-api.eu-west-1.amazonaws.com/prod/number_stores"
+)
+DATE_DETAILS_URL = (
+    "https://data-handling-public.s3.eu-west-1.amazonaws.com/date_details.json"
+)
+CARD_DETAILS_URL = (
+    "https://data-handling-public.s3.eu-west-1.amazonaws.com/card_details.pdf"
+)
+
+# answers worth retrying, as in DataExtractor.build_session
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RateLimiter:
+    """Spaces calls out so that at most `rate` start per second, across every coroutine of the loop."""
+
+    def __init__(self, rate):
+        """
+        Args:
+            rate (float): calls per second. None or 0 disables the limit.
+        """
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        """Waits for the next free slot."""
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AsyncDataExtractor:
+    """Coroutine versions of the DataExtractor sources, sharing one HTTP session, thread pool and set of limits."""
+
+    def __init__(
+        self,
+        db_connector=None,
+        max_concurrency=16,
+        rate_limit=None,
+        retries=3,
+        backoff_factor=0.5,
+        timeout=30,
+    ):
+        """Initialize AsyncDataExtractor. Use it as an async context manager.
+
+        Args:
+            db_connector (DatabaseConnector, optional): Connector for the RDS reads. Defaults to None,
+                which makes DataExtractor create one.
+            max_concurrency (int, optional): HTTP requests and blocking calls in flight at once, across
+                every source. Defaults to 16.
+            rate_limit (float, optional): HTTP requests and blocking calls started per second, across
+                every source. Defaults to None, no limit.
+            retries (int, optional): Retries per HTTP request on 429 and 5xx responses. Defaults to 3.
+            backoff_factor (float, optional): Exponential backoff factor between retries. Defaults to 0.5.
+            timeout (float, optional): Timeout of each HTTP request in seconds. Defaults to 30.
+        """
+        self.extractor = DataExtractor(db_connector)
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(rate_limit)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+        self._executor = None
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+        self._executor.shutdown(wait=False)
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """
+        Runs a blocking call in the thread pool, within the concurrency and rate limits.
+
+        The call reports its metrics to the stage measured on the event loop's thread.
+        """
+        async with self._semaphore:
+            await self.rate_limiter.acquire()
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, metrics.bind(functools.partial(func, *args, **kwargs))
+            )
+
+    async def get_json(self, URL_string, headers=None):
+        """
+        Gets a JSON document with the shared session, within the concurrency and rate limits.
+
+        Requests answered with 429 or 5xx are retried with exponential backoff, or after the
+        Retry-After the server asks for.
+
+        Args:
+            URL_string (str): URL of the document.
+            headers (dict, optional): HTTP headers for the request. Defaults to None.
+
+        Raises:
+            aiohttp.ClientResponseError: If the server still answers with an error status.
+
+        Returns:
+            The decoded JSON.
+        """
+        for attempt in range(self.retries + 1):
+            async with self._semaphore:
+                await self.rate_limiter.acquire()
+                async with self._session.get(URL_string, headers=headers) as r:
+                    body = await r.read()
+                    metrics.count_bytes(received=len(body))
+                    if r.status not in RETRY_STATUSES or attempt == self.retries:
+                        r.raise_for_status()
+                        return await r.json(content_type=None)
+                    retry_after = r.headers.get("Retry-After", "")
+            delay = self.backoff_factor * 2**attempt
+            if retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            await asyncio.sleep(delay)
+
+    async def read_rds_table(self, table_name, partitions=None):
+        """Coroutine version of DataExtractor.read_rds_table, run in the thread pool."""
+        return await self.run_blocking(
+            self.extractor.read_rds_table, table_name, partitions=partitions
+        )
+
+    async def read_rds_tables(self, table_names=None, partitions=4):
+        """Coroutine version of DataExtractor.read_rds_tables, run in the thread pool."""
+        return await self.run_blocking(
+            self.extractor.read_rds_tables, table_names, partitions=partitions
+        )
+
+    async def retrieve_pdf_data(self, URL=CARD_DETAILS_URL, **kwargs):
+        """Coroutine version of DataExtractor.retrieve_pdf_data, run in the thread pool."""
+        return await self.run_blocking(DataExtractor.retrieve_pdf_data, URL, **kwargs)
+
+    async def extract_from_s3(
+        self, bucket_name="data-handling-public", file_key="products.csv", **kwargs
+    ):
+        """Coroutine version of DataExtractor.extract_from_s3, run in the thread pool."""
+        return await self.run_blocking(
+            DataExtractor.extract_from_s3, bucket_name, file_key, **kwargs
+        )
+
+    async def list_number_of_stores(
+        self, n_stores_API_endpoint=NUMBER_OF_STORES_URL, headers=None
+    ):
+        """
+        Gets the number of stores from an API endpoint.
+
+        Returns:
+            int or None: Number of stores or None if the request is unsuccessful.
+        """
+        try:
+            return (await self.get_json(n_stores_API_endpoint, headers))[
+                "number_stores"
+            ]
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def fetch_store_details(self, URL_string, headers=None):
+        """
+        Gets the details of a single store.
+
+        Returns:
+            dict or None: Store details or None if the request is unsuccessful.
+        """
+        try:
+            return await self.get_json(URL_string, headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def retrieve_stores_data(
+        self,
+        headers=None,
+        base_URL=STORE_DETAILS_URL,
+        n_stores_API_endpoint=NUMBER_OF_STORES_URL,
+    ):
+        """
+        Retrieve details of all stores from an API, like DataExtractor.retrieve_stores_data.
+
+        Every store is requested at once; the concurrency and rate limits decide how many
+        requests are in flight.
+
+        Args:
+            headers (dict, optional): HTTP headers for the request. Defaults to the API_KEY environment variable.
+            base_URL (str, optional): Base URL for store details API. Defaults to a preset URL.
+            n_stores_API_endpoint (str, optional): API endpoint to get number of stores. Defaults to a preset URL.
+
+        Returns:
+            pd.DataFrame or None: DataFrame containing store details, in store number order, or None if unsuccessful.
+        """
+        if headers is None:
+            api_key = config.get("API_KEY")
+            if api_key is None:
+                raise Exception(
+                    "Please set the API_KEY environment variable before running this script."
+                )
+            headers = {"x-api-key": api_key}
+
+        n = await self.list_number_of_stores(n_stores_API_endpoint, headers)
+        if n is None:
+            return None
+
+        results = await asyncio.gather(
+            *(
+                self.fetch_store_details(base_URL.format(store_number=i), headers)
+                for i in range(n)
+            )
+        )
+        failed_store_numbers = [i for i, result in enumerate(results) if result is None]
+        if failed_store_numbers:
+            print(
+                f"{len(failed_store_numbers)} of {n} stores could not be retrieved: {failed_store_numbers}"
+            )
+        df_stores_info = pd.DataFrame(
+            [result for result in results if result is not None]
+        )
+        df_stores_info.attrs["failed_store_numbers"] = failed_store_numbers
+        return df_stores_info
+
+    async def extract_json_from_URL(
+        self, endpoint_URL=DATE_DETAILS_URL, use_cache=False
+    ):
+        """
+        Extracts JSON data from a URL into a Pandas DataFrame.
+
+        Args:
+            endpoint_URL (str, optional): The URL where the JSON data is located. Defaults to a preset URL.
+            use_cache (bool, optional): Read the JSON through the local DownloadCache in the thread pool
+                instead of with the shared session. Defaults to False.
+
+        Returns:
+            pd.DataFrame: DataFrame containing the JSON data.
+        """
+        if use_cache:
+            return await self.run_blocking(
+                DataExtractor.extract_json_from_URL, endpoint_URL, use_cache=True
+            )
+        return pd.DataFrame(await self.get_json(endpoint_URL))
+
+    def sources(self):
+        """The coroutine functions extracting each pipeline's source, keyed by pipeline name."""
+        return {
+            "user": lambda: self.read_rds_table("legacy_users"),
+            "card": self.retrieve_pdf_data,
+            "store": self.retrieve_stores_data,
+            "product": self.extract_from_s3,
+            "order": lambda: self.read_rds_table("orders_table"),
+            "date_event": self.extract_json_from_URL,
+        }
+
+    async def extract_all(self, names=None):
+        """
+        Extracts several sources concurrently.
+
+        Args:
+            names (list of str, optional): pipeline names, keys of `sources()`. Defaults to all of them.
+
+        Returns:
+            tuple: (dict mapping each extracted pipeline name to its DataFrame,
+            dict mapping the name of each failed extraction to its exception)
+        """
+        sources = self.sources()
+        names = list(names or sources)
+        results = await asyncio.gather(
+            *(sources[name]() for name in names), return_exceptions=True
+        )
+        frames, errors = {}, {}
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                errors[name] = result
+            else:
+                frames[name] = result
+        return frames, errors
@@ -0,0 +1 @@
+"""Benchmarks and synthetic data generators for the ETL pipeline. Run the scripts from the repository root, e.g. `python -m benchmarks.bench_transformations`."""
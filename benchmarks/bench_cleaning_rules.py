@@ -0,0 +1,140 @@
+"""
+Checks the declarative cleaning specs against the step-by-step cleaning they replaced and times both.
+
+The output of every spec must be identical to the original DataCleaning method's:
+same columns, dtypes, index and values.
+
+Usage:
+    python -m benchmarks.bench_cleaning_rules [--rows 100000]
+"""
+
+import argparse
+
+import pandas as pd
+
+import cleaning_rules
+import transformations
+from benchmarks import synthetic
+from benchmarks.bench_transformations import assert_same, best_of, report
+
+
+def stepwise_clean_user_data(df_user):
+    """The original DataCleaning.clean_user_data."""
+    if "index" in df_user.columns:
+        df_user = df_user.drop("index", axis=1)
+    df_user = transformations.clean_upper_or_numeric_rows(df_user)
+    unparsed_dates = {}
+    for column in ("date_of_birth", "join_date"):
+        df_user[column], unparsed_dates[column] = transformations.parse_dates(
+            df_user[column]
+        )
+    df_user["address"] = transformations.remove_newline_character(df_user["address"])
+    df_user = transformations.email_address_cleaner(df_user)
+    df_user = transformations.clean_country_code_ggb(df_user)
+    df_user["country_code"] = df_user["country_code"].astype("category")
+    df_user["country"] = df_user["country"].astype("category")
+    df_user.attrs["unparsed_dates"] = unparsed_dates
+    return df_user
+
+
+def stepwise_clean_card_data(df):
+    """The original DataCleaning.clean_card_data."""
+    df = transformations.drop_rows_with_invalid_card_numbers(df)
+    df = transformations.clean_upper_or_numeric_rows(df)
+    df.date_payment_confirmed = df.date_payment_confirmed.astype("datetime64[as]")
+    df.card_provider = df.card_provider.astype("str")
+    df["expiry_date"] = pd.to_datetime(df["expiry_date"], format="%m/%y")
+    return df
+
+
+def stepwise_clean_store_data(df):
+    """The original DataCleaning.clean_store_data."""
+    df = df.drop("lat", axis=1)
+    df = df.drop("index", axis=1)
+    df.continent = df.continent.str.replace("ee", "")
+    df = transformations.clean_upper_or_numeric_rows(df)
+    df.address = transformations.remove_newline_character(df.address)
+    df.staff_numbers = df.staff_numbers.str.replace(r"\D", "", regex=True)
+    df = transformations.clean_user_data_rows_all_NULL(df)
+    df = transformations.clean_country_code_ggb(df)
+    df.locality = df.locality.astype("category")
+    df.store_type = df.store_type.astype("category")
+    df.country_code = df.country_code.astype("category")
+    df.continent = df.continent.astype("category")
+    df.staff_numbers = pd.to_numeric(df.staff_numbers)
+    return df
+
+
+def stepwise_clean_product_data(df_products):
+    """The original DataCleaning.clean_product_data."""
+    if "Unnamed: 0" in df_products.columns:
+        df_products.drop("Unnamed: 0", axis=1, inplace=True)
+    df_products = transformations.clean_upper_or_numeric_rows(df_products)
+    df_products.dropna(inplace=True)
+    df_products.rename(columns={"weight": "weight(KG)"}, inplace=True)
+    return df_products
+
+
+def stepwise_clean_orders_data(df):
+    """The original DataCleaning.clean_orders_data."""
+    df.drop(columns={"level_0", "index", "1", "first_name", "last_name"}, inplace=True)
+    df.dropna(axis=0, subset=["card_number"], inplace=True)
+    return df
+
+
+def stepwise_clean_date_events(df):
+    """The original DataCleaning.clean_date_events."""
+    df = transformations.clean_upper_or_numeric_rows(df)
+    df["month"] = df["month"].astype("int")
+    df["year"] = df["year"].astype("int")
+    df["day"] = df["day"].astype("int")
+    df["datetime"], unparsed = transformations.datetime_from_parts(
+        df["year"], df["month"], df["day"], df["timestamp"]
+    )
+    df.attrs["unparsed_dates"] = {"datetime": unparsed}
+    return df
+
+
+CLEANERS = {
+    "user": (synthetic.make_users, stepwise_clean_user_data),
+    "card": (synthetic.make_cards, stepwise_clean_card_data),
+    "store": (synthetic.make_stores, stepwise_clean_store_data),
+    "product": (synthetic.make_products, stepwise_clean_product_data),
+    "order": (synthetic.make_orders, stepwise_clean_orders_data),
+    "date_event": (synthetic.make_date_events, stepwise_clean_date_events),
+}
+
+
+def bench_spec(name, n_rows):
+    make, clean_method = CLEANERS[name]
+    df = make(n_rows)
+    # the step-by-step cleaning modifies its input, so each call gets a fresh copy
+    baseline_seconds, expected = best_of(lambda: clean_method(df.copy()))
+    optimised_seconds, result = best_of(lambda: cleaning_rules.clean(name, df.copy()))
+    assert list(result.columns) == list(expected.columns), f"{name}: columns differ"
+    assert_same(result, expected)
+    report(f"{name} spec ({len(df):,} rows)", baseline_seconds, optimised_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check and benchmark the cleaning specs against the step-by-step cleaning"
+    )
+    parser.add_argument(
+        "--rows", type=int, default=100_000, help="Rows in the synthetic frames"
+    )
+    parser.add_argument(
+        "--tables",
+        nargs="+",
+        default=list(CLEANERS),
+        choices=list(CLEANERS),
+        help="Tables to check",
+    )
+    args = parser.parse_args()
+
+    for name in args.tables:
+        bench_spec(name, args.rows)
+
+
+if __name__ == "__main__":
+    main()
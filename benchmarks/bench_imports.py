@@ -0,0 +1,120 @@
+"""
+Import-time budget for the CLI and the pipeline modules.
+
+Each module is imported in a fresh interpreter, --repeat times, and the fastest import is
+compared with its budget. The check also fails if a module imports a heavy dependency
+it should leave to the code that needs it (`python main.py --help` should never load
+pandas; a date_event run should never load boto3 or tabula), or if importing it prints
+anything or changes the environment, as loading `.env` at import time used to.
+
+Budgets are the wall times measured on a laptop with a small margin, so a new import of
+pandas-sized cost fails the check. Scale them with --scale on slower machines.
+The script exits with status 1 if any check fails.
+
+Usage:
+    python -m benchmarks.bench_imports [--repeat 5] [--scale 1.0]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module -> (budget in seconds, modules it must not import)
+BUDGETS = {
+    "config": (0.01, ("pandas", "requests")),
+    "metrics": (0.05, ("pandas",)),
+    "main": (0.1, ("pandas", "sqlalchemy", "boto3", "requests", "tabula")),
+    # both measured at about 0.8 s, nearly all of it pandas and SQLAlchemy
+    "data_extraction": (1.0, ("boto3", "requests", "tabula")),
+    "pipeline": (1.0, ("boto3", "requests", "tabula", "aiohttp")),
+}
+
+# run in the child interpreter: times one import and reports what it loaded and did
+PROBE = """
+import contextlib, importlib, io, json, os, sys, time
+sys.path.insert(0, sys.argv[1])
+environ = dict(os.environ)
+output = io.StringIO()
+start = time.perf_counter()
+with contextlib.redirect_stdout(output):
+    importlib.import_module(sys.argv[2])
+seconds = time.perf_counter() - start
+print(json.dumps({
+    "seconds": seconds,
+    "modules": sorted({name.split(".")[0] for name in sys.modules}),
+    "output": output.getvalue(),
+    "environ_changed": dict(os.environ) != environ,
+}))
+"""
+
+
+def probe(module, work_dir):
+    """Imports `module` in a fresh interpreter started in `work_dir` and returns the probe's report."""
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE, REPO_DIR, module],
+        cwd=work_dir,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def check(module, budget, forbidden, repeat, work_dir):
+    """
+    Checks one module against its budget.
+
+    Returns:
+        list of str: the failed checks, empty if it passed
+    """
+    reports = [probe(module, work_dir) for _ in range(repeat)]
+    seconds = min(report["seconds"] for report in reports)
+    report = reports[0]
+    failures = []
+    if seconds > budget:
+        failures.append(f"took {seconds * 1000:.0f} ms, budget {budget * 1000:.0f} ms")
+    loaded = [name for name in forbidden if name in report["modules"]]
+    if loaded:
+        failures.append(f"imports {', '.join(loaded)}")
+    if report["output"]:
+        failures.append(f"prints {report['output'].strip()!r}")
+    if report["environ_changed"]:
+        failures.append("changes os.environ")
+    status = "ok" if not failures else "FAIL: " + "; ".join(failures)
+    print(
+        f"{module:<16} {seconds * 1000:8.1f} ms  (budget {budget * 1000:.0f} ms)  {status}"
+    )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import-time budgets")
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Fresh interpreters per module"
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Multiply every budget by this factor"
+    )
+    args = parser.parse_args()
+
+    failed = []
+    # a .env in the working directory, which an import must not read
+    with tempfile.TemporaryDirectory() as work_dir:
+        with open(os.path.join(work_dir, ".env"), "w") as f:
+            f.write("API_KEY=not-to-be-loaded\n")
+        for module, (budget, forbidden) in BUDGETS.items():
+            if check(module, budget * args.scale, forbidden, args.repeat, work_dir):
+                failed.append(module)
+
+    if failed:
+        print(f"Over budget: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Benchmark suite for the cleaning and load stages of every pipeline, compared with a stored baseline.
+
+For each table a synthetic, dirty frame of the chosen size is generated, then the suite times
+
+- the table's DataCleaning method,
+- loading the cleaned frame into SQLite with DataFrame.to_sql (always available),
+- loading it into PostgreSQL with DatabaseConnector.upload_to_db, through COPY and through
+  to_sql, when --db-creds points at a credentials file.
+
+The timings are compared with the baseline for the same size in benchmarks/baselines/ and
+the script exits with status 1 if any stage is more than --tolerance times slower than its
+baseline. Baselines are machine-specific: record your own with --update-baseline before
+comparing changes.
+
+Usage:
+    python -m benchmarks.bench_pipelines [--size 10k] [--db-creds db_creds.yaml] [--update-baseline]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+
+import pandas as pd
+import sqlalchemy
+
+import data_cleaning
+import database_utils
+from benchmarks import synthetic
+from benchmarks.bench_transformations import best_of
+
+SIZES = {"10k": 10_000, "1M": 1_000_000, "10M": 10_000_000}
+
+TABLES = {
+    "user": (synthetic.make_users, data_cleaning.DataCleaning.clean_user_data),
+    "order": (synthetic.make_orders, data_cleaning.DataCleaning.clean_orders_data),
+    "card": (synthetic.make_cards, data_cleaning.DataCleaning.clean_card_data),
+    "store": (synthetic.make_stores, data_cleaning.DataCleaning.clean_store_data),
+    "product": (synthetic.make_products, data_cleaning.DataCleaning.clean_product_data),
+    "date_event": (
+        synthetic.make_date_events,
+        data_cleaning.DataCleaning.clean_date_events,
+    ),
+}
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+
+def bench_table(name, n_rows, sqlite_engine, db_connector=None, env="LOCAL", repeat=5):
+    """
+    Times the cleaning and load stages of one table.
+
+    Returns:
+        dict: seconds per stage, keyed '<table>.clean', '<table>.load.sqlite', ...
+    """
+    make, clean = TABLES[name]
+    raw = make(n_rows)
+    table_name = f"bench_{name}"
+    # a fresh copy per call, as when the baselines were recorded
+    seconds, cleaned = best_of(lambda: clean(raw.copy()), repeat=repeat)
+    results = {f"{name}.clean": seconds}
+
+    results[f"{name}.load.sqlite"], _ = best_of(
+        lambda: cleaned.to_sql(
+            table_name, sqlite_engine, index=False, if_exists="replace"
+        ),
+        repeat=repeat,
+    )
+    if db_connector is not None:
+        for method in ("copy", "to_sql"):
+            results[f"{name}.load.postgres_{method}"], _ = best_of(
+                lambda: db_connector.upload_to_db(
+                    table_name, cleaned, if_exists="replace", env=env, method=method
+                ),
+                repeat=repeat,
+            )
+        with db_connector.init_db_engine(env=env).begin() as connection:
+            connection.execute(sqlalchemy.text(f'DROP TABLE IF EXISTS "{table_name}"'))
+    return results
+
+
+def baseline_path(size):
+    return os.path.join(BASELINE_DIR, f"{size}.json")
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints each stage's time next to its baseline.
+
+    Returns:
+        list of str: the stages more than `tolerance` times slower than their baseline
+    """
+    regressions = []
+    print(f"{'stage':<30}{'seconds':>10}{'baseline':>10}{'ratio':>8}")
+    for stage, seconds in results.items():
+        expected = baseline.get(stage)
+        if expected is None:
+            print(f"{stage:<30}{seconds:>10.3f}{'':>10}{'':>8}")
+            continue
+        ratio = seconds / expected if expected else float("inf")
+        flag = "  REGRESSION" if ratio > tolerance else ""
+        print(f"{stage:<30}{seconds:>10.3f}{expected:>10.3f}{ratio:>8.2f}{flag}")
+        if flag:
+            regressions.append(stage)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the cleaning and load stages against a stored baseline"
+    )
+    parser.add_argument(
+        "--size", choices=list(SIZES), default="10k", help="Rows per synthetic table"
+    )
+    parser.add_argument(
+        "--tables",
+        nargs="+",
+        default=list(TABLES),
+        choices=list(TABLES),
+        help="Tables to benchmark",
+    )
+    parser.add_argument(
+        "--db-creds",
+        default=None,
+        help="db_creds.yaml with a PostgreSQL section to benchmark the COPY and to_sql loads against",
+    )
+    parser.add_argument(
+        "--env", default="LOCAL", help="Credentials section to use. Default LOCAL."
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Runs per stage, the best one counts"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.5,
+        help="Slowdown against the baseline reported as a regression. Default 1.5.",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store these timings as the baseline for --size instead of comparing",
+    )
+    args = parser.parse_args()
+
+    db_connector = (
+        database_utils.DatabaseConnector(args.db_creds) if args.db_creds else None
+    )
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sqlite_engine = sqlalchemy.create_engine(
+            f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+        )
+        for name in args.tables:
+            results.update(
+                bench_table(
+                    name,
+                    SIZES[args.size],
+                    sqlite_engine,
+                    db_connector,
+                    args.env,
+                    args.repeat,
+                )
+            )
+        sqlite_engine.dispose()
+
+    path = baseline_path(args.size)
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                baseline = json.load(f)["seconds"]
+        baseline.update(results)
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "rows": SIZES[args.size],
+                    "machine": platform.platform(),
+                    "python": platform.python_version(),
+                    "pandas": pd.__version__,
+                    "seconds": baseline,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+        print(f"Baseline for {args.size} written to {path}")
+        return
+
+    baseline = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            baseline = json.load(f)["seconds"]
+    else:
+        print(f"No baseline for {args.size} yet, record one with --update-baseline")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} stages regressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Benchmarks for the generalised transformations.
+
+Each benchmark checks that the optimised function gives the same result as the
+implementation it replaced before timing both.
+
+Usage:
+    python -m benchmarks.bench_transformations [--rows 1000000]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import transformations
+from benchmarks import synthetic
+
+
+def applymap_clean_upper_or_numeric_rows(df):
+    """The original cell-by-cell implementation of clean_upper_or_numeric_rows."""
+    return df.drop(
+        df[df.applymap(transformations.is_upper_or_numeric).all(axis=1)].index
+    )
+
+
+def apply_convert_product_weights(df_products):
+    """The original row-by-row implementation of convert_product_weights."""
+
+    def clean_weight_entry(entry):
+        entry = str(entry).lower()
+        if "x" in entry and "g" in entry:
+            x_g_string = entry.strip("g").split("x")
+            return float(x_g_string[0]) * float(x_g_string[1]) / 1000
+        elif "kg" in entry:
+            return float(entry.replace("kg", ""))
+        elif "g" in entry:
+            return float(entry.replace("g", "")) / 1000
+        elif "ml" in entry:
+            return float(entry.replace("ml", "")) / 1000
+        elif "oz" in entry:
+            return float(entry.replace("oz", "")) * 0.0283495
+        else:
+            return None
+
+    df_products["weight(KG)"] = transformations.remove_newline_character(
+        df_products["weight(KG)"]
+    )
+    df_products["weight(KG)"] = df_products["weight(KG)"].str.strip(".")
+    df_products["weight(KG)"] = df_products["weight(KG)"].apply(clean_weight_entry)
+
+
+def concatenated_datetime_from_parts(df):
+    """The original clean_date_events conversion: concatenate the parts, infer the format."""
+    return pd.to_datetime(
+        df["year"].astype(str)
+        + "-"
+        + df["month"].astype(str)
+        + "-"
+        + df["day"].astype(str)
+        + " "
+        + df["timestamp"]
+    )
+
+
+def apply_find_na_rows(df):
+    """The original row-by-row implementation of find_na_rows."""
+    return df[df.apply(lambda row: row.astype(str).str.contains("N/A").any(), axis=1)]
+
+
+def assert_same(result, expected):
+    """Checks two frames are identical: values, dtypes, index and columns (faster than assert_frame_equal on object columns)."""
+    assert list(result.dtypes) == list(expected.dtypes), "dtypes differ"
+    assert result.equals(expected), "frames differ"
+
+
+def best_of(func, *args, repeat=3):
+    """Best wall time of `repeat` calls, and the result of the last call."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def report(name, baseline_seconds, optimised_seconds):
+    print(
+        f"{name}: {baseline_seconds:.3f}s -> {optimised_seconds:.3f}s "
+        f"({baseline_seconds / optimised_seconds:.1f}x)"
+    )
+
+
+def bench_clean_upper_or_numeric_rows(n_rows):
+    df = synthetic.make_users(n_rows)
+    baseline_seconds, expected = best_of(
+        applymap_clean_upper_or_numeric_rows, df, repeat=1
+    )
+    optimised_seconds, result = best_of(transformations.clean_upper_or_numeric_rows, df)
+    assert_same(result, expected)
+    report(
+        f"clean_upper_or_numeric_rows ({n_rows:,} rows)",
+        baseline_seconds,
+        optimised_seconds,
+    )
+
+
+def bench_convert_product_weights(n_rows, products_csv=None):
+    if products_csv:
+        df = pd.read_csv(products_csv)
+        df = df.loc[df.index.repeat(max(1, n_rows // len(df)))].reset_index(drop=True)
+    else:
+        df = synthetic.make_products(n_rows)
+    # the original parser fails on the all upper case junk rows, so both run on cleaned rows
+    df = transformations.clean_upper_or_numeric_rows(df).rename(
+        columns={"weight": "weight(KG)"}
+    )
+
+    def run(convert):
+        frame = df.copy()
+        convert(frame)
+        return frame["weight(KG)"].to_numpy(dtype=float)
+
+    baseline_seconds, expected = best_of(run, apply_convert_product_weights)
+    optimised_seconds, result = best_of(run, transformations.convert_product_weights)
+    assert np.array_equal(result, expected, equal_nan=True), "weights differ"
+    report(
+        f"convert_product_weights ({len(df):,} rows)",
+        baseline_seconds,
+        optimised_seconds,
+    )
+
+
+def bench_parse_dates(n_rows):
+    df = transformations.clean_upper_or_numeric_rows(synthetic.make_users(n_rows))
+    for column in ("date_of_birth", "join_date"):
+        baseline_seconds, expected = best_of(pd.to_datetime, df[column])
+        optimised_seconds, (result, unparsed) = best_of(
+            transformations.parse_dates, df[column]
+        )
+        assert unparsed.empty, f"{len(unparsed)} unparsed dates"
+        assert result.equals(expected), "dates differ"
+        report(
+            f"parse_dates {column} ({len(df):,} rows)",
+            baseline_seconds,
+            optimised_seconds,
+        )
+
+
+def bench_datetime_from_parts(n_rows):
+    df = transformations.clean_upper_or_numeric_rows(synthetic.make_date_events(n_rows))
+    df = df.astype({"year": int, "month": int, "day": int})
+    baseline_seconds, expected = best_of(concatenated_datetime_from_parts, df)
+    optimised_seconds, (result, unparsed) = best_of(
+        transformations.datetime_from_parts,
+        df["year"],
+        df["month"],
+        df["day"],
+        df["timestamp"],
+    )
+    assert unparsed.empty, f"{len(unparsed)} unparsed rows"
+    assert result.equals(expected), "datetimes differ"
+    report(
+        f"datetime_from_parts ({len(df):,} rows)", baseline_seconds, optimised_seconds
+    )
+
+
+def bench_find_na_rows(n_rows):
+    # the row-by-row original needs minutes for a million rows
+    n_rows = min(n_rows, 50_000)
+    df = synthetic.make_users(n_rows)
+    rng = np.random.default_rng(0)
+    for column in ("phone_number", "address", "company"):
+        df.loc[rng.random(len(df)) < 0.01, column] = "N/A"
+    baseline_seconds, expected = best_of(apply_find_na_rows, df, repeat=1)
+    optimised_seconds, result = best_of(transformations.find_na_rows, df)
+    assert_same(result, expected)
+    report(f"find_na_rows ({n_rows:,} rows)", baseline_seconds, optimised_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the transformations module")
+    parser.add_argument(
+        "--rows", type=int, default=1_000_000, help="Rows in the synthetic frames"
+    )
+    parser.add_argument(
+        "--products-csv",
+        default=None,
+        help="products.csv to benchmark the weight parser on, repeated up to --rows rows. Synthetic products by default.",
+    )
+    args = parser.parse_args()
+
+    bench_clean_upper_or_numeric_rows(args.rows)
+    bench_convert_product_weights(args.rows, args.products_csv)
+    bench_parse_dates(args.rows)
+    bench_datetime_from_parts(args.rows)
+    bench_find_na_rows(args.rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Synthetic, dirty versions of the source tables for benchmarking.
+
+The generators reproduce the shape and the known corruptions of the real sources
+(all upper case junk rows, mixed date formats, '@@' emails, 'GGB' country codes...)
+so the cleaning code does the same work it does on real data. Every generator is
+seeded, so the same (n_rows, seed) always gives the same frame.
+"""
+
+import numpy as np
+import pandas as pd
+
+FIRST_NAMES = [
+    "Sigfried",
+    "Guy",
+    "Harry",
+    "Andreas",
+    "Lisa",
+    "Gerald",
+    "Alison",
+    "Jutta",
+]
+LAST_NAMES = [
+    "Noack",
+    "Allen",
+    "Lawrence",
+    "Bönisch",
+    "Hughes",
+    "Pehlke",
+    "Walker",
+    "Martin",
+]
+COUNTRIES = [("Germany", "DE"), ("United Kingdom", "GB"), ("United States", "US")]
+DOB_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%B %Y %d", "%Y %B %d"]
+
+
+def junk_strings(rng, n, length=10):
+    """Random upper case alphanumeric strings, like the junk rows in the sources."""
+    alphabet = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"))
+    return ["".join(row) for row in rng.choice(alphabet, size=(n, length))]
+
+
+def random_dates(rng, n, start="1940-01-01", end="2022-12-31"):
+    """Uniformly distributed dates between start and end."""
+    start, end = pd.Timestamp(start).value, pd.Timestamp(end).value
+    return pd.to_datetime(rng.integers(start, end, size=n)).normalize()
+
+
+def format_dates(rng, dates, formats=DOB_FORMATS, p_iso=0.9):
+    """Formats dates mostly as ISO, with the rest spread over the other formats."""
+    p = [p_iso] + [(1 - p_iso) / (len(formats) - 1)] * (len(formats) - 1)
+    choice = rng.choice(len(formats), size=len(dates), p=p)
+    out = np.empty(len(dates), dtype=object)
+    for i, fmt in enumerate(formats):
+        selected = choice == i
+        out[selected] = dates[selected].strftime(fmt)
+    return out
+
+
+def corrupt_rows(rng, df, share, skip=("index",)):
+    """Overwrites a share of rows with all upper case junk, or with 'NULL' everywhere."""
+    n_bad = int(len(df) * share)
+    rows = rng.choice(len(df), size=n_bad, replace=False)
+    null_rows, junk_rows = rows[: n_bad // 3], rows[n_bad // 3 :]
+    for column in df.columns:
+        if column in skip:
+            continue
+        df[column] = df[column].astype(object)
+        df.iloc[junk_rows, df.columns.get_loc(column)] = junk_strings(
+            rng, len(junk_rows)
+        )
+        df.iloc[null_rows, df.columns.get_loc(column)] = "NULL"
+    return df
+
+
+def make_users(n_rows=10_000, seed=0, junk_share=0.01):
+    """Synthetic legacy_users table."""
+    rng = np.random.default_rng(seed)
+    country = rng.integers(0, len(COUNTRIES), size=n_rows)
+    country_name = np.array([c[0] for c in COUNTRIES])[country]
+    country_code = np.array([c[1] for c in COUNTRIES], dtype=object)[country]
+    country_code[rng.random(n_rows) < 0.01] = "GGB"
+    first = rng.choice(FIRST_NAMES, size=n_rows)
+    last = rng.choice(LAST_NAMES, size=n_rows)
+    email = pd.Series(first).str.lower() + "." + pd.Series(last).str.lower()
+    email = email + np.where(rng.random(n_rows) < 0.01, "@@", "@") + "example.com"
+    df = pd.DataFrame(
+        {
+            "index": np.arange(n_rows),
+            "first_name": first,
+            "last_name": last,
+            "date_of_birth": format_dates(
+                rng, random_dates(rng, n_rows, end="2004-12-31")
+            ),
+            "company": rng.choice(
+                ["Ladeck", "Sauer", "Smith Ltd", "Acme plc"], size=n_rows
+            ),
+            "email_address": email,
+            "address": [f"{i} High Street\nTown {i % 97}" for i in range(n_rows)],
+            "country": country_name,
+            "country_code": country_code,
+            "phone_number": [f"+44(0)20 7946 {i % 10000:04d}" for i in range(n_rows)],
+            "join_date": format_dates(
+                rng, random_dates(rng, n_rows, start="1992-01-01")
+            ),
+            "user_uuid": uuids(rng, n_rows),
+        }
+    )
+    return corrupt_rows(rng, df, junk_share)
+
+
+def uuids(rng, n):
+    """Random UUID strings."""
+    hexes = rng.bytes(16 * n).hex()
+    return [
+        f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+        for h in (hexes[i : i + 32] for i in range(0, 32 * n, 32))
+    ]
+
+
+WEIGHTS = [
+    "590g",
+    "1kg",
+    "12 x 100g",
+    "77g .",
+    "16oz",
+    "400ml",
+    "8 x 150g",
+    "1.5kg",
+    "2.2kg",
+    "125g",
+]
+CATEGORIES = [
+    "toys-and-games",
+    "sports-and-leisure",
+    "pets",
+    "homeware",
+    "health-and-beauty",
+    "food-and-drink",
+    "diy",
+]
+
+
+def make_products(n_rows=10_000, seed=0, junk_share=0.005):
+    """Synthetic products.csv, including the unnamed index column written by the source."""
+    rng = np.random.default_rng(seed)
+    weights = rng.choice(WEIGHTS, size=n_rows).astype(object)
+    weights[rng.random(n_rows) < 0.002] = np.nan
+    df = pd.DataFrame(
+        {
+            "Unnamed: 0": np.arange(n_rows),
+            "product_name": [f"Product {i}" for i in range(n_rows)],
+            "product_price": "£"
+            + pd.Series(rng.integers(100, 100_000, size=n_rows) / 100).map(
+                "{:.2f}".format
+            ),
+            "weight": weights,
+            "category": rng.choice(CATEGORIES, size=n_rows),
+            "EAN": rng.integers(10**12, 10**13, size=n_rows).astype(str),
+            "date_added": random_dates(rng, n_rows, start="1992-01-01").strftime(
+                "%Y-%m-%d"
+            ),
+            "uuid": uuids(rng, n_rows),
+            "removed": rng.choice(
+                ["Still_avaliable", "Removed"], size=n_rows, p=[0.9, 0.1]
+            ),
+            "product_code": [
+                f"{c}{i % 10}-{i}"
+                for c, i in zip(
+                    rng.choice(list("abcdefghijklmnopqrstuvwxyz"), size=n_rows),
+                    range(n_rows),
+                )
+            ],
+        }
+    )
+    return corrupt_rows(rng, df, junk_share, skip=("Unnamed: 0",))
+
+
+CARD_PROVIDERS = [
+    "VISA 16 digit",
+    "Mastercard",
+    "American Express",
+    "Discover",
+    "JCB 16 digit",
+]
+
+
+def make_cards(n_rows=10_000, seed=0, junk_share=0.005):
+    """Synthetic card_details table as tabula returns it, with '?'-prefixed card numbers."""
+    rng = np.random.default_rng(seed)
+    card_number = rng.integers(10**15, 10**16, size=n_rows).astype(str).astype(object)
+    bad = rng.random(n_rows) < 0.003
+    card_number[bad] = ["???" + number for number in card_number[bad]]
+    df = pd.DataFrame(
+        {
+            "card_number": card_number,
+            "expiry_date": [
+                f"{m:02d}/{y:02d}"
+                for m, y in zip(
+                    rng.integers(1, 13, size=n_rows), rng.integers(23, 32, size=n_rows)
+                )
+            ],
+            "card_provider": rng.choice(CARD_PROVIDERS, size=n_rows),
+            "date_payment_confirmed": random_dates(
+                rng, n_rows, start="1992-01-01"
+            ).strftime("%Y-%m-%d"),
+        }
+    )
+    return corrupt_rows(rng, df, junk_share, skip=())
+
+
+def make_stores(n_rows=450, seed=0, junk_share=0.02):
+    """Synthetic store details, as returned by the stores API."""
+    rng = np.random.default_rng(seed)
+    country = rng.integers(0, len(COUNTRIES), size=n_rows)
+    continent = np.where(country == 2, "America", "Europe").astype(object)
+    continent = np.where(rng.random(n_rows) < 0.02, "ee" + continent, continent)
+    staff = rng.integers(5, 100, size=n_rows).astype(str).astype(object)
+    typo = rng.random(n_rows) < 0.02
+    staff[typo] = ["J" + s for s in staff[typo]]
+    df = pd.DataFrame(
+        {
+            "index": np.arange(n_rows),
+            "address": [f"{i} Station Road\nTown {i % 41}" for i in range(n_rows)],
+            "longitude": (rng.random(n_rows) * 10).round(5).astype(str),
+            "lat": None,
+            "locality": rng.choice(
+                ["High Wycombe", "Berlin", "Chapletown", "Hamburg", "Miami"],
+                size=n_rows,
+            ),
+            "store_code": [f"HI-{i:06X}" for i in range(n_rows)],
+            "staff_numbers": staff,
+            "opening_date": random_dates(rng, n_rows, start="1992-01-01").strftime(
+                "%Y-%m-%d"
+            ),
+            "store_type": rng.choice(
+                ["Local", "Super Store", "Mall Kiosk", "Outlet"], size=n_rows
+            ),
+            "latitude": (50 + rng.random(n_rows) * 5).round(5).astype(str),
+            "country_code": np.array([c[1] for c in COUNTRIES])[country],
+            "continent": continent,
+        }
+    )
+    return corrupt_rows(rng, df, junk_share)
+
+
+def make_orders(n_rows=10_000, seed=0):
+    """Synthetic orders_table as read from RDS, with its redundant columns."""
+    rng = np.random.default_rng(seed)
+    card_number = rng.integers(10**15, 10**16, size=n_rows).astype(str).astype(object)
+    card_number[rng.random(n_rows) < 0.001] = None
+    return pd.DataFrame(
+        {
+            "level_0": np.arange(n_rows),
+            "index": np.arange(n_rows),
+            "date_uuid": uuids(rng, n_rows),
+            "first_name": None,
+            "last_name": None,
+            "user_uuid": uuids(rng, n_rows),
+            "card_number": card_number,
+            "store_code": [f"HI-{i:06X}" for i in rng.integers(0, 450, size=n_rows)],
+            "product_code": [
+                f"a{i % 10}-{i}" for i in rng.integers(0, 1800, size=n_rows)
+            ],
+            "1": np.nan,
+            "product_quantity": rng.integers(1, 14, size=n_rows),
+        }
+    )
+
+
+def make_date_events(n_rows=10_000, seed=0, junk_share=0.005):
+    """Synthetic date_details.json, with every field a string."""
+    rng = np.random.default_rng(seed)
+    moments = random_dates(rng, n_rows, start="1992-01-01") + pd.to_timedelta(
+        rng.integers(0, 86400, size=n_rows), unit="s"
+    )
+    hours = moments.hour
+    df = pd.DataFrame(
+        {
+            "timestamp": moments.strftime("%H:%M:%S"),
+            "month": moments.month.astype(str),
+            "year": moments.year.astype(str),
+            "day": moments.day.astype(str),
+            "time_period": np.select(
+                [hours < 6, hours < 12, hours < 18],
+                ["Late_Hours", "Morning", "Midday"],
+                "Evening",
+            ),
+            "date_uuid": uuids(rng, n_rows),
+        }
+    )
+    return corrupt_rows(rng, df, junk_share, skip=())
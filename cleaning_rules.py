@@ -0,0 +1,341 @@
+"""
+Declarative cleaning rules, compiled into a single-copy execution plan.
+
+Each table's cleaning is a spec: an ordered list of (column, operation, arguments)
+rules, with column None for rules that apply to the whole frame. `compile_spec` turns a
+spec into a plan that
+
+- merges literal string replacements on the same column into one regex pass,
+- collects row filters into one boolean mask, applied once, just before the first rule
+  that could fail on a rejected row (a type conversion) or at the end,
+- works on one copy of the input, assigning columns in place instead of creating a new
+  frame per step.
+
+The DataCleaning methods run the specs in SPECS through `clean(name, df)`. Each row filter
+reports the rows it drops to the stage metrics, under the name in FILTER_RULES.
+"""
+
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import transformations
+
+Step = namedtuple("Step", ["kind", "column", "operation", "args"])
+
+# operations that change values row by row and cannot fail on junk rows
+STRING_OPERATIONS = ("replace",)
+# operations that decide which rows to keep
+FILTER_OPERATIONS = (
+    "drop_upper_or_numeric_rows",
+    "drop_rows_all_equal",
+    "drop_rows_containing",
+    "dropna",
+)
+# name each filter's dropped rows are reported under, that of the transformation it replaced
+FILTER_RULES = {
+    "drop_upper_or_numeric_rows": "clean_upper_or_numeric_rows",
+    "drop_rows_all_equal": "clean_user_data_rows_all_NULL",
+    "drop_rows_containing": "drop_rows_with_invalid_card_numbers",
+    "dropna": "dropna",
+}
+# operations that convert types; rejected rows are removed before they run
+CONVERSION_OPERATIONS = (
+    "astype",
+    "to_datetime",
+    "parse_dates",
+    "to_numeric",
+    "datetime_from_parts",
+)
+# operations on the set of columns
+COLUMN_OPERATIONS = ("drop_column", "rename")
+
+
+SPECS = {
+    "user": [
+        ("index", "drop_column", {"if_present": True}),
+        (None, "drop_upper_or_numeric_rows", {}),
+        ("date_of_birth", "parse_dates", {}),
+        ("join_date", "parse_dates", {}),
+        ("address", "replace", {"pattern": "\n", "repl": ", "}),
+        ("email_address", "replace", {"pattern": "@@", "repl": "@"}),
+        ("country_code", "replace", {"pattern": "GGB", "repl": "GB"}),
+        ("country_code", "astype", {"dtype": "category"}),
+        ("country", "astype", {"dtype": "category"}),
+    ],
+    "card": [
+        ("card_number", "drop_rows_containing", {"pattern": "?"}),
+        (None, "drop_upper_or_numeric_rows", {}),
+        ("date_payment_confirmed", "astype", {"dtype": "datetime64[as]"}),
+        ("card_provider", "astype", {"dtype": "str"}),
+        ("expiry_date", "to_datetime", {"format": "%m/%y"}),
+    ],
+    "store": [
+        ("lat", "drop_column", {}),
+        ("index", "drop_column", {}),
+        ("continent", "replace", {"pattern": "ee", "repl": ""}),
+        (None, "drop_upper_or_numeric_rows", {}),
+        ("address", "replace", {"pattern": "\n", "repl": ", "}),
+        ("staff_numbers", "replace", {"pattern": r"\D", "repl": "", "regex": True}),
+        (None, "drop_rows_all_equal", {"value": "NULL"}),
+        ("country_code", "replace", {"pattern": "GGB", "repl": "GB"}),
+        ("locality", "astype", {"dtype": "category"}),
+        ("store_type", "astype", {"dtype": "category"}),
+        ("country_code", "astype", {"dtype": "category"}),
+        ("continent", "astype", {"dtype": "category"}),
+        ("staff_numbers", "to_numeric", {}),
+    ],
+    "product": [
+        ("Unnamed: 0", "drop_column", {"if_present": True}),
+        (None, "drop_upper_or_numeric_rows", {}),
+        (None, "dropna", {}),
+        ("weight", "rename", {"to": "weight(KG)"}),
+    ],
+    "order": [
+        ("level_0", "drop_column", {}),
+        ("index", "drop_column", {}),
+        ("1", "drop_column", {}),
+        ("first_name", "drop_column", {}),
+        ("last_name", "drop_column", {}),
+        ("card_number", "dropna", {}),
+    ],
+    "date_event": [
+        (None, "drop_upper_or_numeric_rows", {}),
+        ("month", "astype", {"dtype": "int"}),
+        ("year", "astype", {"dtype": "int"}),
+        ("day", "astype", {"dtype": "int"}),
+        (
+            "datetime",
+            "datetime_from_parts",
+            {"year": "year", "month": "month", "day": "day", "time": "timestamp"},
+        ),
+    ],
+}
+
+
+def _kind(operation):
+    for kind, operations in (
+        ("string", STRING_OPERATIONS),
+        ("filter", FILTER_OPERATIONS),
+        ("conversion", CONVERSION_OPERATIONS),
+        ("columns", COLUMN_OPERATIONS),
+    ):
+        if operation in operations:
+            return kind
+    raise ValueError(f"Unknown cleaning operation '{operation}'")
+
+
+def _can_merge(replacements):
+    """
+    Whether literal replacements give the same result applied at once as one after another.
+
+    That holds when no pattern shares a character with another pattern or with another
+    replacement text, so no replacement can create, extend or break a match of another pattern.
+    """
+    for i, (pattern, _) in enumerate(replacements):
+        others = "".join(
+            other_pattern + other_repl
+            for j, (other_pattern, other_repl) in enumerate(replacements)
+            if j != i
+        )
+        if set(pattern) & set(others):
+            return False
+    return True
+
+
+def compile_spec(spec):
+    """
+    Compiles a cleaning spec into a list of plan steps.
+
+    Args:
+        spec (list of tuple): (column, operation, arguments) rules, in order
+
+    Raises:
+        ValueError: If a rule names an unknown operation.
+
+    Returns:
+        list of Step: the plan, run by `execute_plan`
+    """
+    plan = []
+    for column, operation, args in spec:
+        kind = _kind(operation)
+        if kind == "string" and not args.get("regex", False):
+            # merge into the last step touching this column, if that is a literal replacement
+            previous = next(
+                (
+                    step
+                    for step in reversed(plan)
+                    if step.column == column or step.kind in ("filter", "columns")
+                ),
+                None,
+            )
+            if (
+                previous is not None
+                and previous.kind == "string"
+                and previous.operation == "replace_literals"
+                and previous.column == column
+                and _can_merge(previous.args + [(args["pattern"], args["repl"])])
+            ):
+                previous.args.append((args["pattern"], args["repl"]))
+                continue
+            plan.append(
+                Step(
+                    kind, column, "replace_literals", [(args["pattern"], args["repl"])]
+                )
+            )
+            continue
+        if operation == "drop_column":
+            # consecutive column drops become one drop
+            if plan and plan[-1].operation == "drop_columns":
+                plan[-1].args.append((column, args.get("if_present", False)))
+                continue
+            plan.append(
+                Step(
+                    kind,
+                    None,
+                    "drop_columns",
+                    [(column, args.get("if_present", False))],
+                )
+            )
+            continue
+        plan.append(Step(kind, column, operation, args))
+    return plan
+
+
+def _replace_literals(series, replacements):
+    if len(replacements) == 1:
+        pattern, repl = replacements[0]
+        return series.str.replace(pattern, repl, regex=False)
+    lookup = dict(replacements)
+    combined = "|".join(re.escape(pattern) for pattern, _ in replacements)
+    return series.str.replace(combined, lambda m: lookup[m.group(0)], regex=True)
+
+
+def _filter_mask(df, step):
+    """Boolean array, True for the rows the filter step keeps."""
+    if step.operation == "drop_upper_or_numeric_rows":
+        return ~transformations.upper_or_numeric_rows_mask(df)
+    if step.operation == "drop_rows_all_equal":
+        return ~df.eq(step.args["value"]).all(axis=1).to_numpy()
+    if step.operation == "drop_rows_containing":
+        return ~transformations.contains_mask(df[step.column], step.args["pattern"])
+    if step.operation == "dropna":
+        subset = df if step.column is None else df[[step.column]]
+        return subset.notna().all(axis=1).to_numpy()
+    raise ValueError(f"Unknown filter '{step.operation}'")
+
+
+def _record_unparsed(df, column, unparsed):
+    # a new dict, since frames derived from one another share their attrs' values
+    df.attrs["unparsed_dates"] = {
+        **df.attrs.get("unparsed_dates", {}),
+        column: unparsed,
+    }
+
+
+def _convert(df, step):
+    if step.operation == "astype":
+        df[step.column] = df[step.column].astype(step.args["dtype"])
+    elif step.operation == "to_datetime":
+        df[step.column] = pd.to_datetime(df[step.column], **step.args)
+    elif step.operation == "to_numeric":
+        df[step.column] = pd.to_numeric(df[step.column])
+    elif step.operation == "parse_dates":
+        df[step.column], unparsed = transformations.parse_dates(
+            df[step.column], **step.args
+        )
+        _record_unparsed(df, step.column, unparsed)
+    elif step.operation == "datetime_from_parts":
+        a = step.args
+        df[step.column], unparsed = transformations.datetime_from_parts(
+            df[a["year"]], df[a["month"]], df[a["day"]], df[a["time"]]
+        )
+        _record_unparsed(df, step.column, unparsed)
+
+
+def execute_plan(plan, df):
+    """
+    Runs a compiled plan on a DataFrame. The input is not modified.
+
+    Args:
+        plan (list of Step): plan from `compile_spec`
+        df (pd.DataFrame): raw table
+
+    Returns:
+        pd.DataFrame: cleaned table
+    """
+    # the input is copied once, by the first step that creates a new frame or by the
+    # first in-place column assignment, whichever comes first
+    owned = False
+    keep = None
+
+    def apply_filters(df, keep):
+        if keep is None or keep.all():
+            return df, False
+        return df.take(np.flatnonzero(keep)), True
+
+    for step in plan:
+        if step.kind == "columns":
+            if step.operation == "drop_columns":
+                columns = [
+                    column
+                    for column, if_present in step.args
+                    if column in df.columns or not if_present
+                ]
+                if columns:
+                    df, owned = df.drop(columns=columns), True
+            elif step.operation == "rename":
+                df, owned = df.rename(columns={step.column: step.args["to"]}), True
+            continue
+
+        if step.kind == "filter":
+            mask = _filter_mask(df, step)
+            # rows this filter drops among those the filters before it kept, as if
+            # the filters had run one after another
+            kept = len(mask) if keep is None else np.count_nonzero(keep)
+            keep = mask if keep is None else keep & mask
+            metrics.count_dropped(
+                FILTER_RULES[step.operation], int(kept - np.count_nonzero(keep))
+            )
+            continue
+
+        if step.kind == "conversion":
+            df, filtered = apply_filters(df, keep)
+            owned, keep = owned or filtered, None
+        if not owned:
+            df, owned = df.copy(), True
+
+        if step.kind == "string":
+            if step.operation == "replace_literals":
+                df[step.column] = _replace_literals(df[step.column], step.args)
+            else:
+                df[step.column] = df[step.column].str.replace(
+                    step.args["pattern"], step.args["repl"], regex=True
+                )
+        elif step.kind == "conversion":
+            _convert(df, step)
+
+    df, filtered = apply_filters(df, keep)
+    return df if owned or filtered else df.copy()
+
+
+_compiled = {}
+
+
+def clean(name, df):
+    """
+    Cleans a table with its spec from SPECS, compiling the spec on first use.
+
+    Args:
+        name (str): table name, a key of SPECS ('user', 'card', 'store', 'product', 'order', 'date_event')
+        df (pd.DataFrame): raw table
+
+    Returns:
+        pd.DataFrame: cleaned table
+    """
+    if name not in _compiled:
+        _compiled[name] = compile_spec(SPECS[name])
+    return execute_plan(_compiled[name], df)
@@ -1,22 +1,53 @@
 """
 Configurations for the project.
 
-This module reads key-value pairs from a `.env` file and sets them as
-environment variables. It then retrieves the API_KEY from the environment.
+Settings come from the environment and from the key-value pairs of a `.env` file. The file
+is only read the first time a setting is asked for, and at most once, so importing this
+module has no side effects.
 
 Attributes:
-    api_key (str): The API key retrieved from the environment.
+    api_key (str): The API key, read from the environment on first access.
 """
 
-
+import functools
 import os
 
-with open(".env", "r") as f:
-    for line in f:
-        if line.strip() == "" or line.startswith("#"):
-            continue
-        key, value = line.strip().split("=", 1)
-        os.environ[key] = value
+ENV_FILE = ".env"
+
+
+@functools.lru_cache(maxsize=None)
+def load_env(path=ENV_FILE):
+    """
+    Reads the key-value pairs of a `.env` file and sets them as environment variables.
+
+    The file is read once per path; later calls return the cached pairs.
+
+    Args:
+        path (str, optional): Path of the file. Defaults to ".env".
+
+    Returns:
+        dict: the pairs read, empty if the file does not exist
+    """
+    values = {}
+    if not os.path.exists(path):
+        return values
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip() == "" or line.startswith("#"):
+                continue
+            key, value = line.strip().split("=", 1)
+            values[key] = value
+    os.environ.update(values)
+    return values
+
+
+def get(key, default=None):
+    """Returns a setting from the environment, after loading the `.env` file on first use."""
+    load_env()
+    return os.environ.get(key, default)
+
 
-api_key = os.environ.get("API_KEY")
-print(api_key)
+def __getattr__(name):
+    if name == "api_key":
+        return get("API_KEY")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,12 +1,59 @@
 import pandas as pd
+import sqlalchemy
 from database_utils import DatabaseConnector
-import tabula
-import requests
+from download_cache import DownloadCache
+import metrics
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import hashlib
+import io
 import json
-import boto3
+import multiprocessing
+import re
 import os
 import config
 
+# the products.csv columns clean_product_data keeps (it drops the unnamed index column)
+PRODUCTS_USECOLS = [
+    "product_name",
+    "product_price",
+    "weight",
+    "category",
+    "EAN",
+    "date_added",
+    "uuid",
+    "removed",
+    "product_code",
+]
+
+# dtypes of the products.csv columns. Every kept column has junk rows (all upper case codes)
+# that clean_product_data removes, so read_csv would infer each of them as text anyway;
+# declaring them gives the cached and the streamed read, and every chunk, the same types.
+# EAN is an identifier and the prices carry a currency sign, so they stay text until schema.prepare.
+PRODUCTS_DTYPES = {
+    "Unnamed: 0": "int64",
+    "product_name": str,
+    "product_price": str,
+    "weight": str,
+    "category": str,
+    "EAN": str,
+    "date_added": str,
+    "uuid": str,
+    "removed": str,
+    "product_code": str,
+}
+
+
+def count_pdf_pages(pdf_bytes):
+    """Counts the page objects in a PDF. Returns 0 when they are hidden in compressed object streams."""
+    return len(re.findall(rb"/Type\s*/Page(?![a-zA-Z])", pdf_bytes))
+
+
+def read_pdf_pages(path, pages):
+    """Reads the tables on a page range of a PDF, e.g. pages="1-10". Module level so worker processes can run it."""
+    import tabula
+
+    return tabula.read_pdf(path, pages=pages)
+
 
 class DataExtractor:
     """Class to handle various types of data extraction methods."""
@@ -21,37 +68,421 @@ class DataExtractor:
             db_connector = DatabaseConnector()
         self.db_connector = db_connector
 
-    def read_rds_table(self, table_name):
+    def read_rds_table(self, table_name, chunksize=None, partitions=None):
         """
         Reads a table from RDS into a Pandas DataFrame.
 
         Args:
             table_name (str): Name of the table to read from RDS.
+            chunksize (int, optional): If given, stream the table in chunks of this many rows
+                instead of loading it whole. Defaults to None.
+            partitions (int, optional): If greater than 1, read the table as this many key-range
+                slices over concurrent connections, see read_rds_table_partitioned. A table
+                without an integer key to split on is read whole. Defaults to None.
 
         Raises:
             ValueError: If the table cannot be read.
 
         Returns:
-            pd.DataFrame: DataFrame containing table data.
+            pd.DataFrame or Iterator[pd.DataFrame]: DataFrame containing table data, or an
+            iterator of DataFrames of at most `chunksize` rows when `chunksize` is given.
         """
 
+        if chunksize is not None:
+            return self.stream_rds_table(table_name, chunksize)
         engine = self.db_connector.init_db_engine()
+        if partitions is not None and partitions > 1:
+            table = sqlalchemy.Table(
+                table_name, sqlalchemy.MetaData(), autoload_with=engine
+            )
+            queries = self._partition_queries(engine, table, partitions)
+            # as in read_rds_tables, a table without an integer key is read whole
+            if queries is not None:
+                return self._read_partitioned(engine, table, queries, partitions)
         return pd.read_sql_table(table_name, engine)
 
+    def stream_rds_table(self, table_name, chunksize=50000):
+        """
+        Reads a table from RDS in fixed-size chunks through a server-side cursor.
+
+        Only one chunk is held in memory at a time, so peak memory is bounded by
+        `chunksize` rather than by the size of the table.
+
+        Args:
+            table_name (str): Name of the table to read from RDS.
+            chunksize (int, optional): Number of rows per chunk. Defaults to 50000.
+
+        Yields:
+            pd.DataFrame: Consecutive chunks of the table.
+        """
+        engine = self.db_connector.init_db_engine()
+        with engine.connect().execution_options(stream_results=True) as connection:
+            for chunk in pd.read_sql_table(table_name, connection, chunksize=chunksize):
+                yield chunk
+
+    def reflect_rds_table(self, table_name):
+        """
+        Reflects a table's columns and their types from RDS.
+
+        Args:
+            table_name (str): Name of the table in RDS.
+
+        Returns:
+            sqlalchemy.Table: The reflected table.
+        """
+        return sqlalchemy.Table(
+            table_name,
+            sqlalchemy.MetaData(),
+            autoload_with=self.db_connector.init_db_engine(),
+        )
+
+    @staticmethod
+    def _partition_queries(engine, table, partitions, column=None):
+        """
+        Splits a reflected table into SELECTs over contiguous ranges of an integer key.
+
+        The key is `column`, else the table's single-column integer primary key, else its
+        `index` column. The range between the key's minimum and maximum is cut into
+        `partitions` equal slices, each ordered by the key, and rows without a key value,
+        if there are any, are read by a last query, so the slices together hold every row
+        in key order.
+
+        Returns:
+            list: SELECT statements, or None if the table has no integer key to split on
+        """
+        if column is None:
+            primary_key = list(table.primary_key.columns)
+            if len(primary_key) == 1 and isinstance(
+                primary_key[0].type, sqlalchemy.Integer
+            ):
+                column = primary_key[0].name
+            elif "index" in table.c:
+                column = "index"
+        if column is None or not isinstance(table.c[column].type, sqlalchemy.Integer):
+            return None
+
+        key = table.c[column]
+        query = sqlalchemy.select(table)
+        with engine.connect() as connection:
+            low, high, nulls = connection.execute(
+                sqlalchemy.select(
+                    sqlalchemy.func.min(key),
+                    sqlalchemy.func.max(key),
+                    sqlalchemy.func.count() - sqlalchemy.func.count(key),
+                )
+            ).one()
+        if low is None:
+            return [query]
+        step = -(-(high - low + 1) // partitions)  # ceiling division
+        bounds = list(range(low, high + 1, step)) + [high + 1]
+        queries = [
+            query.where(key >= start, key < end).order_by(key)
+            for start, end in zip(bounds, bounds[1:])
+        ]
+        if nulls:
+            queries.append(query.where(key.is_(None)))
+        return queries
+
+    @staticmethod
+    def _harmonize_dtypes(df, table):
+        """
+        Gives a frame read with read_sql the dtypes read_sql_table gives the whole table.
+
+        read_sql infers each slice's dtypes from its own rows, so a column that is all NULL
+        in one slice is object there and stays object once the slices are concatenated.
+        The dtypes follow the column types, as in read_sql_table: floats are float64,
+        integers int64 (float64 with NULLs), dates datetime64 and booleans bool (object
+        with NULLs).
+        """
+        for column in table.columns:
+            if column.name not in df.columns:
+                continue
+            values = df[column.name]
+            has_na = values.isna().any()
+            if isinstance(column.type, sqlalchemy.Float):
+                dtype = "float64"
+            elif isinstance(column.type, sqlalchemy.Integer):
+                if not has_na:
+                    dtype = "int64"
+                elif values.dtype == object and values.notna().any():
+                    dtype = "float64"
+                else:
+                    continue
+            elif isinstance(column.type, sqlalchemy.Boolean) and not has_na:
+                dtype = "bool"
+            elif isinstance(column.type, (sqlalchemy.DateTime, sqlalchemy.Date)):
+                if values.dtype == object:
+                    df[column.name] = pd.to_datetime(
+                        values,
+                        errors="coerce",
+                        utc=getattr(column.type, "timezone", False),
+                    )
+                continue
+            else:
+                continue
+            if values.dtype != dtype:
+                df[column.name] = values.astype(dtype)
+        return df
+
+    def _read_slices(self, engine, table, queries, max_workers):
+        """Submits the slice queries to a thread pool. Returns the pool and the futures, in query order."""
+        pool_capacity = self.db_connector.pool_size + self.db_connector.max_overflow
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(len(queries), max_workers, pool_capacity))
+        )
+        read = metrics.bind(
+            lambda query: self._harmonize_dtypes(pd.read_sql(query, engine), table)
+        )
+        return executor, [executor.submit(read, query) for query in queries]
+
+    def _concat_slices(self, frames, table):
+        # empty slices carry no dtypes worth keeping
+        frames = [frame for frame in frames if len(frame)] or frames[:1]
+        return self._harmonize_dtypes(pd.concat(frames, ignore_index=True), table)
+
+    def _reflect_partitions(self, engine, table_name, partitions, column):
+        table = sqlalchemy.Table(
+            table_name, sqlalchemy.MetaData(), autoload_with=engine
+        )
+        queries = self._partition_queries(engine, table, partitions, column)
+        if queries is None:
+            raise ValueError(
+                f"'{table_name}' has no integer key to partition on, pass one as column"
+            )
+        return table, queries
+
+    def read_rds_table_partitioned(
+        self, table_name, partitions=8, column=None, max_workers=None
+    ):
+        """
+        Reads a table from RDS as key-range slices over concurrent pooled connections.
+
+        The table is split on an integer key (see `column`) into `partitions` slices of
+        equal key range, which are read in parallel and reassembled in key order, with the
+        dtypes read_rds_table gives. The slices are about equal in size when the key is
+        dense, like the `index` column.
+
+        Args:
+            table_name (str): Name of the table to read from RDS.
+            partitions (int, optional): Number of key-range slices. Defaults to 8.
+            column (str, optional): Integer column to split on. Defaults to the table's single-column
+                integer primary key, or else its `index` column.
+            max_workers (int, optional): Slices read at once, capped by the engine's pool size plus
+                overflow. Defaults to `partitions`.
+
+        Raises:
+            ValueError: If the table has no integer column to split on.
+
+        Returns:
+            pd.DataFrame: DataFrame containing table data, in key order.
+        """
+        engine = self.db_connector.init_db_engine()
+        table, queries = self._reflect_partitions(
+            engine, table_name, partitions, column
+        )
+        return self._read_partitioned(engine, table, queries, max_workers or partitions)
+
+    def _read_partitioned(self, engine, table, queries, max_workers):
+        executor, futures = self._read_slices(engine, table, queries, max_workers)
+        with executor:
+            frames = [future.result() for future in futures]
+        return self._concat_slices(frames, table)
+
+    def stream_rds_partitions(
+        self, table_name, partitions=8, column=None, max_workers=None
+    ):
+        """
+        Reads a table from RDS as concurrent key-range slices, yielding each one as it arrives.
+
+        Like read_rds_table_partitioned, but the slices are handed over in the order the
+        reads finish, so they can be cleaned while the others are still being read. Each
+        slice is a separate DataFrame with its own RangeIndex. Empty slices (key ranges
+        without rows) are skipped, unless the whole table is empty.
+
+        Args:
+            table_name (str): Name of the table to read from RDS.
+            partitions (int, optional): Number of key-range slices. Defaults to 8.
+            column (str, optional): Integer column to split on, see read_rds_table_partitioned.
+            max_workers (int, optional): Slices read at once. Defaults to `partitions`.
+
+        Raises:
+            ValueError: If the table has no integer column to split on.
+
+        Yields:
+            pd.DataFrame: The slices of the table, in the order they are read.
+        """
+        engine = self.db_connector.init_db_engine()
+        table, queries = self._reflect_partitions(
+            engine, table_name, partitions, column
+        )
+        executor, futures = self._read_slices(
+            engine, table, queries, max_workers or partitions
+        )
+        with executor:
+            try:
+                yielded, empty = False, None
+                for future in as_completed(futures):
+                    frame = future.result()
+                    if len(frame):
+                        yielded = True
+                        yield frame
+                    elif empty is None:
+                        empty = frame
+                # an empty table still yields one frame, with its columns
+                if not yielded and empty is not None:
+                    yield empty
+            finally:
+                # a consumer that stops early does not wait for the unread slices
+                for future in futures:
+                    future.cancel()
+
+    def read_rds_tables(self, table_names=None, partitions=4, max_workers=None):
+        """
+        Reads several RDS tables at once, by default every table list_db_tables finds.
+
+        The slices of every table (see read_rds_table_partitioned) share one thread pool,
+        so up to `max_workers` reads are in flight across all tables. Tables without an
+        integer key are read whole, as a single slice.
+
+        Args:
+            table_names (list of str, optional): Tables to read. Defaults to every table in the RDS database.
+            partitions (int, optional): Key-range slices per table. Defaults to 4.
+            max_workers (int, optional): Reads in flight at once, capped by the engine's pool size
+                plus overflow. Defaults to that cap.
+
+        Returns:
+            dict: table name -> pd.DataFrame with the table's data
+        """
+        if table_names is None:
+            table_names = self.db_connector.list_db_tables()
+        engine = self.db_connector.init_db_engine()
+        tables, queries = {}, []
+        for table_name in table_names:
+            table = sqlalchemy.Table(
+                table_name, sqlalchemy.MetaData(), autoload_with=engine
+            )
+            table_queries = self._partition_queries(engine, table, partitions) or [
+                sqlalchemy.select(table)
+            ]
+            tables[table_name] = (table, len(queries), len(table_queries))
+            queries += table_queries
+
+        # one pool for every slice; each slice is harmonized against its own table
+        pool_capacity = self.db_connector.pool_size + self.db_connector.max_overflow
+        threads = max(1, min(len(queries), max_workers or pool_capacity, pool_capacity))
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            frames = list(
+                executor.map(
+                    metrics.bind(lambda query: pd.read_sql(query, engine)), queries
+                )
+            )
+        return {
+            table_name: self._concat_slices(frames[first : first + count], table)
+            for table_name, (table, first, count) in tables.items()
+        }
+
+    def read_rds_table_since(self, table_name, column, watermark=None, chunksize=None):
+        """
+        Reads the rows of an RDS table past a watermark, ordered by the watermark column.
+
+        Args:
+            table_name (str): Name of the table to read from RDS.
+            column (str): Monotonically increasing column, e.g. a primary key or a timestamp.
+            watermark (optional): Only rows with `column` greater than this are read. None reads every row.
+            chunksize (int, optional): If given, stream the rows in chunks of this many rows. Defaults to None.
+
+        Returns:
+            pd.DataFrame or Iterator[pd.DataFrame]: The new rows, or an iterator of chunks of them
+            when `chunksize` is given.
+        """
+        engine = self.db_connector.init_db_engine()
+        table = sqlalchemy.Table(
+            table_name, sqlalchemy.MetaData(), autoload_with=engine
+        )
+        query = sqlalchemy.select(table).order_by(table.c[column])
+        if watermark is not None:
+            query = query.where(table.c[column] > watermark)
+
+        if chunksize is None:
+            return pd.read_sql(query, engine)
+        return self._stream_query(engine, query, chunksize)
+
+    @staticmethod
+    def _stream_query(engine, query, chunksize):
+        with engine.connect().execution_options(stream_results=True) as connection:
+            for chunk in pd.read_sql(query, connection, chunksize=chunksize):
+                yield chunk
+
     @staticmethod
     def retrieve_pdf_data(
         URL="https://data-handling-public.s3.eu-west-1.amazonaws.com/card_details.pdf",
+        use_cache=True,
+        parsed_cache_dir=".cache/parsed",
+        workers=1,
     ):
         """Uses tabula-py to read a PDF document's table into a DataFrame
 
+        When the PDF is available locally (through the DownloadCache, or as a local path) the parsed
+        table is cached as a pickle, keyed by the SHA-256 of the PDF bytes, so an unchanged PDF is only
+        parsed once and later runs skip starting the JVM. The pickle keeps the parsed frame exactly, so
+        a cached table cleans the same as a freshly parsed one.
+
         Args:
             URL (str): location of PDF
+            use_cache (bool, optional): Read the PDF through the local DownloadCache, only downloading it
+                again if it changed, and cache the parsed table. Defaults to True.
+            parsed_cache_dir (str, optional): Directory for the parsed tables. Defaults to ".cache/parsed".
+            workers (int, optional): Worker processes parsing page ranges in parallel when the parsed table
+                is not cached. Defaults to 1.
 
         Returns:
             pd.DataFrame
         """
-        all_pages = tabula.read_pdf(URL, pages="all")
+        if use_cache and URL.startswith(("http://", "https://")):
+            URL = DownloadCache().fetch_url(URL)
+        if not use_cache or not os.path.exists(URL):
+            import tabula
+
+            all_pages = tabula.read_pdf(URL, pages="all")
+            return pd.concat(all_pages, ignore_index=True, join="inner")
+
+        with open(URL, "rb") as f:
+            pdf_bytes = f.read()
+        cache_path = os.path.join(
+            parsed_cache_dir, f"{hashlib.sha256(pdf_bytes).hexdigest()}.pkl"
+        )
+        if os.path.exists(cache_path):
+            return pd.read_pickle(cache_path)
+        # only a table that is not cached needs tabula, and with it the JVM
+        import tabula
+
+        n_pages = count_pdf_pages(pdf_bytes)
+        if workers > 1 and n_pages > 1:
+            step = -(-n_pages // workers)  # ceiling division
+            page_ranges = [
+                f"{first}-{min(first + step - 1, n_pages)}"
+                for first in range(1, n_pages + 1, step)
+            ]
+            # spawned, as the pipelines call this from a thread, see pipeline.run_pipelines
+            with ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                # map keeps the page ranges, and so the rows, in page order
+                all_pages = [
+                    table
+                    for tables in executor.map(
+                        read_pdf_pages, [URL] * len(page_ranges), page_ranges
+                    )
+                    for table in tables
+                ]
+        else:
+            all_pages = tabula.read_pdf(URL, pages="all")
         df_pdf = pd.concat(all_pages, ignore_index=True, join="inner")
+
+        os.makedirs(parsed_cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.part"
+        df_pdf.to_pickle(tmp_path)
+        os.replace(tmp_path, cache_path)
         return df_pdf
 
     @staticmethod
@@ -66,31 +497,101 @@ class DataExtractor:
         Returns:
             int or None: Number of stores or None if the request is unsuccessful.
         """
+        import requests
+
         r = requests.get(n_stores_API_endpoint, headers=headers)
         if r.status_code == 200:
             return json.loads(r.text)["number_stores"]
         else:
             return None  # or raise an exception
 
+    @staticmethod
+    def build_session(pool_size=10, retries=3, backoff_factor=0.5):
+        """
+        Builds a keep-alive requests session for repeated calls to the same API host.
+
+        Args:
+            pool_size (int, optional): Number of pooled connections kept open. Defaults to 10.
+            retries (int, optional): Retries per request on 429 and 5xx responses. Defaults to 3.
+            backoff_factor (float, optional): Exponential backoff factor between retries. Defaults to 0.5.
+
+        Returns:
+            requests.Session: Session with a pooled, retrying HTTP adapter mounted.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @staticmethod
+    def fetch_store_details(session, URL_string, headers, timeout=30):
+        """
+        Gets the details of a single store.
+
+        Args:
+            session (requests.Session): Session used for the request.
+            URL_string (str): Store details endpoint for one store number.
+            headers (dict): HTTP headers for the request.
+            timeout (float, optional): Request timeout in seconds. Defaults to 30.
+
+        Returns:
+            dict or None: Store details or None if the request is unsuccessful.
+        """
+        import requests
+
+        try:
+            r = session.get(URL_string, headers=headers, timeout=timeout)
+        except requests.RequestException:
+            return None
+        metrics.count_bytes(received=len(r.content))
+        if r.status_code == 200:
+            return r.json()
+        return None
+
     @staticmethod
     def retrieve_stores_data(
         headers=None,
         base_URL="https://aqj7u5id95.execute-api.eu-west-1.amazonaws.com/prod/store_details/{store_number}",
         n_stores_API_endpoint="https://aqj7u5id95.execute-api.eu-west-1.amazonaws.com/prod/number_stores",
+        max_workers=16,
+        retries=3,
+        backoff_factor=0.5,
     ):
         """
         Retrieve details of all stores from an API.
 
+        Store details are fetched concurrently over a shared keep-alive session, with at most
+        `max_workers` requests in flight. Requests answered with 429 or 5xx are retried with
+        exponential backoff. Store numbers that still fail are printed and listed in
+        `df.attrs["failed_store_numbers"]`.
+
         Args:
             headers (dict, optional): HTTP headers for the request. Defaults to None.
             base_URL (str, optional): Base URL for store details API. Defaults to a preset URL.
             n_stores_API_endpoint (str, optional): API endpoint to get number of stores. Defaults to a preset URL.
+            max_workers (int, optional): Maximum number of concurrent requests. 1 fetches sequentially. Defaults to 16.
+            retries (int, optional): Retries per store on 429 and 5xx responses. Defaults to 3.
+            backoff_factor (float, optional): Exponential backoff factor between retries. Defaults to 0.5.
 
         Returns:
-            pd.DataFrame or None: DataFrame containing store details or None if unsuccessful.
+            pd.DataFrame or None: DataFrame containing store details, in store number order, or None if unsuccessful.
         """
         if headers == None:
-            api_key = os.environ.get("API_KEY")
+            api_key = config.get("API_KEY")
             if api_key == None:
                 raise Exception(
                     "Please set the API_KEY environment variable before running this script."
@@ -103,45 +604,153 @@ class DataExtractor:
 
         endpoints_list = [base_URL.format(store_number=i) for i in range(n)]
 
-        response_list = []
-        for URL_string in endpoints_list:
-            r = requests.get(URL_string, headers=headers)
-            if r.status_code == 200:
-                response_list.append(r.json())
+        max_workers = max(1, min(max_workers, len(endpoints_list) or 1))
+        with DataExtractor.build_session(
+            pool_size=max_workers, retries=retries, backoff_factor=backoff_factor
+        ) as session:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # executor.map yields results in submission order, i.e. store order
+                results = list(
+                    executor.map(
+                        metrics.bind(
+                            lambda URL_string: DataExtractor.fetch_store_details(
+                                session, URL_string, headers
+                            )
+                        ),
+                        endpoints_list,
+                    )
+                )
+
+        response_list = [result for result in results if result is not None]
+        failed_store_numbers = [i for i, result in enumerate(results) if result is None]
+        if failed_store_numbers:
+            print(
+                f"{len(failed_store_numbers)} of {n} stores could not be retrieved: {failed_store_numbers}"
+            )
 
         df_stores_info = pd.DataFrame(response_list)
+        df_stores_info.attrs["failed_store_numbers"] = failed_store_numbers
         return df_stores_info
 
     @staticmethod
-    def extract_from_s3():
+    def extract_from_s3(
+        bucket_name="data-handling-public",
+        file_key="products.csv",
+        use_cache=True,
+        s3_client=None,
+    ):
         """
         Extracts product data from an S3 bucket.
 
+        Args:
+            bucket_name (str, optional): S3 bucket. Defaults to "data-handling-public".
+            file_key (str, optional): Key of the CSV in the bucket. Defaults to "products.csv".
+            use_cache (bool, optional): Download through the local DownloadCache, which only transfers the
+                object again if its ETag changed. If False the object is streamed straight into the CSV
+                parser with stream_from_s3, without writing a file. Defaults to True.
+            s3_client (optional): boto3 S3 client. Defaults to a new boto3.client("s3").
+
         Returns:
             pd.DataFrame: DataFrame containing product details.
         """
-        s3 = boto3.client("s3")
-        bucket_name = "data-handling-public"
-        file_key = "products.csv"
-        local_file_path = "./products.csv"
-        s3.download_file(bucket_name, file_key, local_file_path)
-        df_products = pd.read_csv(local_file_path)
+        if s3_client is None:
+            import boto3
+
+            s3_client = boto3.client("s3")
+        s3 = s3_client
+        if not use_cache:
+            return DataExtractor.stream_from_s3(bucket_name, file_key, s3_client=s3)
+        local_file_path = DownloadCache().fetch_s3(bucket_name, file_key, s3)
+        df_products = pd.read_csv(local_file_path, dtype=PRODUCTS_DTYPES)
         return df_products
 
+    @staticmethod
+    def stream_from_s3(
+        bucket_name="data-handling-public",
+        file_key="products.csv",
+        s3_client=None,
+        usecols=PRODUCTS_USECOLS,
+        dtype=PRODUCTS_DTYPES,
+        chunksize=None,
+        max_workers=1,
+        part_size=8 * 1024 * 1024,
+    ):
+        """
+        Reads a CSV object from S3 straight into the CSV parser, without a temporary file.
+
+        With max_workers > 1, objects larger than part_size are fetched as concurrent ranged GETs
+        and reassembled in memory before parsing.
+
+        Args:
+            bucket_name (str, optional): S3 bucket. Defaults to "data-handling-public".
+            file_key (str, optional): Key of the CSV in the bucket. Defaults to "products.csv".
+            s3_client (optional): boto3 S3 client, e.g. one backed by moto in tests. Defaults to a new boto3.client("s3").
+            usecols (list of str, optional): Columns to parse. Defaults to PRODUCTS_USECOLS, the columns
+                clean_product_data keeps. None parses every column.
+            dtype (optional): dtype(s) passed to pd.read_csv. Defaults to PRODUCTS_DTYPES, the types
+                extract_from_s3 reads the cached file with.
+            chunksize (int, optional): If given, return an iterator of DataFrames of this many rows. Defaults to None.
+            max_workers (int, optional): Concurrent ranged GETs for large objects. Defaults to 1.
+            part_size (int, optional): Bytes per ranged GET. Defaults to 8 MiB.
+
+        Returns:
+            pd.DataFrame or Iterator[pd.DataFrame]: DataFrame containing the CSV, or an iterator of chunks
+            of it when `chunksize` is given.
+        """
+        if s3_client is None:
+            import boto3
+
+            s3_client = boto3.client("s3")
+        s3 = s3_client
+        size = None
+        if max_workers > 1:
+            size = s3.head_object(Bucket=bucket_name, Key=file_key)["ContentLength"]
+
+        if size is not None and size > part_size:
+            ranges = [
+                f"bytes={start}-{min(start + part_size, size) - 1}"
+                for start in range(0, size, part_size)
+            ]
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                parts = executor.map(
+                    lambda byte_range: s3.get_object(
+                        Bucket=bucket_name, Key=file_key, Range=byte_range
+                    )["Body"].read(),
+                    ranges,
+                )
+                body = io.BytesIO(b"".join(parts))
+            metrics.count_bytes(received=size)
+        else:
+            response = s3.get_object(Bucket=bucket_name, Key=file_key)
+            metrics.count_bytes(received=response["ContentLength"])
+            body = response["Body"]
+
+        return pd.read_csv(body, usecols=usecols, dtype=dtype, chunksize=chunksize)
+
     @staticmethod
     def extract_json_from_URL(
         endpoint_URL="https://data-handling-public.s3.eu-west-1.amazonaws.com/date_details.json",
+        use_cache=True,
     ):
         """
         Extracts JSON data from a URL into a Pandas DataFrame.
 
         Args:
             endpoint_URL (str, optional): The URL where the JSON data is located. Defaults to a preset URL.
+            use_cache (bool, optional): Read the JSON through the local DownloadCache, only downloading it
+                again if it changed. Defaults to True.
 
         Returns:
             pd.DataFrame: DataFrame containing the JSON data.
         """
-        response = requests.get(endpoint_URL).text
-        j = json.loads(response)
+        if use_cache:
+            with open(DownloadCache().fetch_url(endpoint_URL), "r") as f:
+                j = json.load(f)
+        else:
+            import requests
+
+            response = requests.get(endpoint_URL)
+            metrics.count_bytes(received=len(response.content))
+            j = json.loads(response.text)
         df_date_events = pd.DataFrame(j)
         return df_date_events
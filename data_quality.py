@@ -0,0 +1,325 @@
+"""
+Data-quality profile of the tables, written to the dq_metrics table.
+
+The profile is taken in the clean stage, in the same call as the cleaning, so it costs no
+extra read of the table. It looks at each column twice, with vectorised operations:
+
+- in the raw frame the cleaning is given, for its missing values and the values that are
+  the string 'NULL' or contain 'N/A', which is what the cleaning removes,
+- in the frame the cleaning returns, for an estimate of its distinct values, from a
+  HyperLogLog sketch, and its smallest and largest value.
+
+Text columns are converted to Arrow for the counts and the min/max, which Arrow's compute
+functions take without a Python call per value. On 300,000 users the profile takes about
+as long as the cleaning itself.
+
+The rows each cleaning rule rejected come from the clean stage's metrics (the
+transformations decorated with `metrics.counts_dropped_rows`), so they are not counted
+again either. Profiles of chunks of one table merge into the profile of the whole table:
+counts add up, sketches take the maximum of their registers and min/max combine.
+
+dq_metrics holds one row per (run, table, column, metric). Table-level metrics (rows_in,
+rows_out and rejected:<rule>) have no column_name. Columns the cleaning drops only have the
+raw counts, and columns it adds only the distinct count and min/max. Counts and estimates are in `value`,
+min and max in `text_value`, and in `value` as well for numeric columns.
+"""
+
+import datetime
+import math
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+import database_utils
+import transformations
+
+# 2**12 registers: a standard error of about 1.6% on the distinct counts, in 4 KiB per column
+HLL_PRECISION = 12
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS dq_metrics (
+    run_at timestamp NOT NULL,
+    table_name text NOT NULL,
+    column_name text,
+    metric text NOT NULL,
+    value double precision,
+    text_value text
+)
+"""
+
+CREATE_INDEX = "CREATE INDEX IF NOT EXISTS ix_dq_metrics_table_name_run_at ON dq_metrics (table_name, run_at)"
+
+
+def _bit_length(values):
+    """Bit lengths of unsigned 32-bit integers, exact since they fit a float64 mantissa."""
+    return np.frexp(values.astype(np.float64))[1]
+
+
+class HyperLogLog:
+    """HyperLogLog sketch of the distinct values of a column, fed 64-bit hashes."""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        """Adds an array of uint64 hashes."""
+        if not len(hashes):
+            return
+        p = self.precision
+        index = (hashes >> np.uint64(64 - p)).astype(np.intp)
+        rest = hashes & np.uint64((1 << (64 - p)) - 1)
+        high = (rest >> np.uint64(32)).astype(np.uint32)
+        low = (rest & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+        bit_length = np.where(high > 0, 32 + _bit_length(high), _bit_length(low))
+        # position of the first set bit of the remaining 64 - p bits
+        rank = (64 - p + 1 - bit_length).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def add(self, series):
+        """Adds the non-missing values of a Series."""
+        self.add_hashes(
+            pd.util.hash_pandas_object(series.dropna(), index=False).to_numpy()
+        )
+
+    def merge(self, other):
+        """Adds the values of another sketch of the same precision."""
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        """Estimated number of distinct values."""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(int)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small sets
+        return estimate
+
+
+class ColumnProfile:
+    """Quality metrics of one column, accumulated over one or more frames."""
+
+    def __init__(self):
+        self.in_raw = False
+        self.nulls = 0
+        self.null_strings = 0
+        self.na_strings = 0
+        self.in_cleaned = False
+        self.sketch = HyperLogLog()
+        self.min = None
+        self.max = None
+
+    def update_raw(self, series):
+        """Adds the missing, 'NULL' and 'N/A' values of a raw Series."""
+        self.in_raw = True
+        strings = transformations.arrow_strings(series)
+        if strings is None:
+            self.nulls += int(series.isna().sum())
+            self.null_strings += int(transformations.equals_mask(series, "NULL").sum())
+        else:
+            import pyarrow.compute as pc
+
+            self.nulls += strings.null_count
+            self.null_strings += int(pc.sum(pc.equal(strings, "NULL")).as_py() or 0)
+        self.na_strings += int(
+            transformations.contains_mask(series, "N/A", strings).sum()
+        )
+
+    def update(self, series):
+        """Adds the distinct values and the min and max of a cleaned Series."""
+        self.in_cleaned = True
+        self.sketch.add(series)
+        self._extend(*_min_max(series))
+
+    def merge(self, other):
+        """Adds the metrics of the same column of another frame."""
+        self.in_raw = self.in_raw or other.in_raw
+        self.nulls += other.nulls
+        self.null_strings += other.null_strings
+        self.na_strings += other.na_strings
+        self.in_cleaned = self.in_cleaned or other.in_cleaned
+        self.sketch.merge(other.sketch)
+        self._extend(other.min, other.max)
+
+    def _extend(self, low, high):
+        if low is None:
+            return
+        if self.min is None:
+            self.min, self.max = low, high
+            return
+        try:
+            self.min, self.max = min(self.min, low), max(self.max, high)
+        except TypeError:  # chunks that gave the column different types
+            low, high = str(low), str(high)
+            self.min, self.max = min(str(self.min), low), max(str(self.max), high)
+
+
+def _min_max(series):
+    """Smallest and largest value of a Series, compared as text unless the column is numeric or temporal."""
+    strings = transformations.arrow_strings(series)
+    if strings is not None:
+        import pyarrow.compute as pc
+
+        extremes = pc.min_max(strings)  # UTF-8 byte order, which is code point order
+        return extremes["min"].as_py(), extremes["max"].as_py()
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # the categories that occur, rather than every value
+        codes = np.unique(series.cat.codes.to_numpy())
+        series = pd.Series(series.cat.categories[codes[codes >= 0]])
+        return _min_max(series)
+    values = series.dropna()
+    if not len(values):
+        return None, None
+    if pd.api.types.is_bool_dtype(values.dtype):
+        values = values.astype(int)
+    if not (
+        pd.api.types.is_numeric_dtype(values.dtype)
+        or pd.api.types.is_datetime64_any_dtype(values.dtype)
+    ):
+        values = values.astype(str)
+    low, high = values.min(), values.max()
+    # numpy scalars as Python values, so profiles pickle small and compare across chunks
+    return getattr(low, "item", lambda: low)(), getattr(high, "item", lambda: high)()
+
+
+class Profile:
+    """Quality metrics of every column of a table."""
+
+    def __init__(self):
+        self.rows = 0
+        self.columns = {}
+
+    def update_raw(self, df):
+        """Adds the missing, 'NULL' and 'N/A' values of a raw frame, e.g. one chunk before cleaning."""
+        for column in df.columns:
+            self.columns.setdefault(str(column), ColumnProfile()).update_raw(df[column])
+        return self
+
+    def update(self, df):
+        """Adds the rows of a cleaned frame, e.g. one cleaned chunk."""
+        self.rows += len(df)
+        for column in df.columns:
+            self.columns.setdefault(str(column), ColumnProfile()).update(df[column])
+        return self
+
+    def merge(self, other):
+        """Adds the metrics of another Profile of the same table."""
+        self.rows += other.rows
+        for column, column_profile in other.columns.items():
+            if column in self.columns:
+                self.columns[column].merge(column_profile)
+            else:
+                self.columns[column] = column_profile
+        return self
+
+    def metrics(self, rows_in=None, rejected=None):
+        """
+        The profile as dq_metrics rows.
+
+        Args:
+            rows_in (int, optional): rows going into the cleaning. Defaults to None.
+            rejected (dict, optional): rule -> rows it rejected, e.g. the `dropped` of the
+                clean stage's metrics.StageRecord. Defaults to None.
+
+        Returns:
+            list of tuple: (column_name, metric, value, text_value)
+        """
+        rows = [(None, "rows_out", self.rows, None)]
+        if rows_in is not None:
+            rows.append((None, "rows_in", rows_in, None))
+        for rule, count in (rejected or {}).items():
+            rows.append((None, f"rejected:{rule}", count, None))
+        for column, column_profile in self.columns.items():
+            if column_profile.in_raw:
+                rows.extend(
+                    [
+                        (column, "nulls", column_profile.nulls, None),
+                        (column, "null_strings", column_profile.null_strings, None),
+                        (column, "na_strings", column_profile.na_strings, None),
+                    ]
+                )
+            if not column_profile.in_cleaned:
+                continue
+            rows.append(
+                (column, "distinct", round(column_profile.sketch.estimate()), None)
+            )
+            for metric, extreme in (
+                ("min", column_profile.min),
+                ("max", column_profile.max),
+            ):
+                if extreme is None:
+                    continue
+                number = float(extreme) if isinstance(extreme, (int, float)) else None
+                rows.append((column, metric, number, str(extreme)))
+        return rows
+
+
+def profile(raw, cleaned):
+    """Profiles a raw frame and the frame its cleaning returned. See Profile."""
+    return Profile().update_raw(raw).update(cleaned)
+
+
+def clean_and_profile(clean, df, profiled=True):
+    """
+    Cleans a frame and profiles it in the same call.
+
+    The raw frame is profiled before it is cleaned, and the cleaned frame after.
+    Module level, so it can be submitted to the process pool in place of the cleaning.
+
+    Args:
+        clean (callable): a DataCleaning method
+        df (pd.DataFrame): raw table
+        profiled (bool, optional): profile the table. Defaults to True.
+
+    Returns:
+        tuple: (cleaned frame, Profile or None)
+    """
+    if not profiled:
+        return clean(df), None
+    table_profile = Profile().update_raw(df)
+    cleaned = clean(df)
+    return cleaned, table_profile.update(cleaned)
+
+
+def write_metrics(table_name, table_profile, rows_in=None, rejected=None, engine=None):
+    """
+    Appends a table's profile to dq_metrics, creating the table if needed.
+
+    Args:
+        table_name (str): the profiled table
+        table_profile (Profile): its profile
+        rows_in (int, optional): see Profile.metrics. Defaults to None.
+        rejected (dict, optional): see Profile.metrics. Defaults to None.
+        engine (sqlalchemy.engine.Engine, optional): Target database. Defaults to the LOCAL engine.
+
+    Returns:
+        int: the number of rows written
+    """
+    engine = engine or database_utils.DatabaseConnector().init_db_engine("LOCAL")
+    run_at = datetime.datetime.now()
+    rows = [
+        {
+            "run_at": run_at,
+            "table_name": table_name,
+            "column_name": column,
+            "metric": metric,
+            "value": value,
+            "text_value": text_value,
+        }
+        for column, metric, value, text_value in table_profile.metrics(
+            rows_in, rejected
+        )
+    ]
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(CREATE_TABLE))
+        connection.execute(sqlalchemy.text(CREATE_INDEX))
+        connection.execute(
+            sqlalchemy.text(
+                "INSERT INTO dq_metrics (run_at, table_name, column_name, metric, value, text_value) "
+                "VALUES (:run_at, :table_name, :column_name, :metric, :value, :text_value)"
+            ),
+            rows,
+        )
+    return len(rows)
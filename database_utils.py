@@ -1,21 +1,145 @@
+import atexit
+import io
+import os
+import threading
+import time
+import uuid
 import yaml
 import sqlalchemy
+import pandas as pd
+import metrics
+
+# Marker for missing values in the COPY CSV stream, so empty strings stay empty strings
+COPY_NULL = "\\N"
+
+
+class TimedQueuePool(sqlalchemy.pool.QueuePool):
+    """QueuePool that counts checkouts and the time spent waiting for a connection, including new connection handshakes."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.checkout_wait_seconds = 0.0
+        self.max_checkout_wait_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.checkout_wait_seconds += waited
+                self.max_checkout_wait_seconds = max(
+                    self.max_checkout_wait_seconds, waited
+                )
 
 
 class DatabaseConnector:
-    def read_db_creds(self, db_creds_file="db_creds.yaml", env="RDS"):
-        """Gets information from the credentials .yaml file, RDS by default"""
-        with open(db_creds_file, "r") as file:
-            y = yaml.safe_load(file)
+    """
+    Connects to the RDS source and the LOCAL target databases.
+
+    Credentials files are parsed once and engines are cached per (credentials file, env)
+    in a registry shared by every DatabaseConnector, so repeated calls reuse the same
+    connection pool. The pool settings of the connector that first creates an engine
+    apply to it. Cached engines are disposed at interpreter exit, or earlier with
+    DatabaseConnector.dispose_engines().
+    """
+
+    _creds_cache = {}
+    _engines = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(
+        self,
+        db_creds_file="db_creds.yaml",
+        pool_size=5,
+        max_overflow=10,
+        pool_pre_ping=True,
+    ):
+        """Initialize DatabaseConnector.
+
+        Args:
+            db_creds_file (str, optional): Path to the credentials .yaml file. Defaults to "db_creds.yaml".
+            pool_size (int, optional): Connections kept open per engine. Defaults to 5.
+            max_overflow (int, optional): Extra connections allowed beyond pool_size under load. Defaults to 10.
+            pool_pre_ping (bool, optional): Test pooled connections before use, replacing dropped ones. Defaults to True.
+        """
+        self.db_creds_file = db_creds_file
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_pre_ping = pool_pre_ping
+
+    def read_db_creds(self, db_creds_file=None, env="RDS"):
+        """Gets information from the credentials .yaml file, RDS by default. The file is parsed once and cached"""
+        db_creds_file = os.path.abspath(db_creds_file or self.db_creds_file)
+        with self._registry_lock:
+            if db_creds_file not in self._creds_cache:
+                with open(db_creds_file, "r") as file:
+                    self._creds_cache[db_creds_file] = yaml.safe_load(file)
+            y = self._creds_cache[db_creds_file]
         return y.get(env)
 
     def init_db_engine(self, env="RDS"):
-        """creates an sqlalchemy database engine from the YAML credentials, allowing for local environment and the RDS"""
-        creds = self.read_db_creds(env=env)
+        """returns the cached sqlalchemy database engine for the environment (RDS or LOCAL), creating it from the YAML credentials on first use"""
+        key = (os.path.abspath(self.db_creds_file), env)
+        engine = self._engines.get(key)
+        if engine is not None:
+            return engine
 
+        creds = self.read_db_creds(env=env)
         connection_string = f"postgresql://{creds['USER']}:{creds['PASSWORD']}@{creds['HOST']}:{creds['PORT']}/{creds['DATABASE']}"
-        engine = sqlalchemy.create_engine(connection_string)
-        return engine
+        with self._registry_lock:
+            if key not in self._engines:
+                self._engines[key] = sqlalchemy.create_engine(
+                    connection_string,
+                    poolclass=TimedQueuePool,
+                    pool_size=self.pool_size,
+                    max_overflow=self.max_overflow,
+                    pool_pre_ping=self.pool_pre_ping,
+                )
+            return self._engines[key]
+
+    def pool_stats(self, env="RDS"):
+        """
+        Reports connection pool usage for an environment's cached engine.
+
+        Args:
+            env (str, optional): Credentials section of db_creds.yaml. Defaults to "RDS".
+
+        Returns:
+            dict or None: Pool size, connections checked in/out, overflow in use, number of
+            checkouts and the total/max seconds spent waiting for a connection, or None if
+            no engine has been created for `env`.
+        """
+        engine = self._engines.get((os.path.abspath(self.db_creds_file), env))
+        if engine is None:
+            return None
+        pool = engine.pool
+        return {
+            "env": env,
+            "pool_size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts": getattr(pool, "checkouts", None),
+            "checkout_wait_seconds": getattr(pool, "checkout_wait_seconds", None),
+            "max_checkout_wait_seconds": getattr(
+                pool, "max_checkout_wait_seconds", None
+            ),
+        }
+
+    @classmethod
+    def dispose_engines(cls):
+        """Closes the pooled connections of every cached engine and empties the registry."""
+        with cls._registry_lock:
+            engines = list(cls._engines.values())
+            cls._engines.clear()
+            cls._creds_cache.clear()
+        for engine in engines:
+            engine.dispose()
 
     def list_db_tables(self):
         """
@@ -48,7 +172,16 @@ class DatabaseConnector:
             table_names = inspector.get_table_names()
         return table_names
 
-    def upload_to_db(self, table_name, dataframe, if_exists="fail", env="LOCAL"):
+    def upload_to_db(
+        self,
+        table_name,
+        dataframe,
+        if_exists="fail",
+        env="LOCAL",
+        method="copy",
+        key=None,
+        dtype=None,
+    ):
         """
         Uploads a DataFrame to the connected database.
 
@@ -56,10 +189,216 @@ class DatabaseConnector:
         - table_name (str): Name of the table to which data should be uploaded.
         - dataframe (pd.DataFrame): The dataframe to be uploaded.
         - if_exists (str): What to do if the table already exists. Options: 'fail', 'replace', 'append'. Default 'fail'.
+        - env (str): Credentials section of db_creds.yaml to connect with. Default 'LOCAL'.
+        - method (str): 'copy' bulk-loads through PostgreSQL COPY (see copy_to_db), 'to_sql' uses
+          DataFrame.to_sql. 'copy' falls back to 'to_sql' on non-PostgreSQL databases. Default 'copy'.
+        - key (list of str): Key columns for if_exists='merge', which is only supported by 'copy'. Default None.
+        - dtype (dict): SQLAlchemy types of some columns, as in DataFrame.to_sql, used when the table is created. Default None.
 
         Returns:
         -------
-        None
+        int or None: rows inserted or changed by 'merge', None otherwise
         """
-        engine = self.init_db_engine(env="LOCAL")
-        dataframe.to_sql(table_name, engine, index=False, if_exists=if_exists)
+        engine = self.init_db_engine(env=env)
+        if method == "copy" and engine.dialect.name == "postgresql":
+            return self.copy_to_db(
+                engine, table_name, dataframe, if_exists=if_exists, key=key, dtype=dtype
+            )
+        dataframe.to_sql(
+            table_name, engine, index=False, if_exists=if_exists, dtype=dtype
+        )
+
+    @staticmethod
+    def copy_to_db(
+        engine, table_name, dataframe, if_exists="fail", key=None, dtype=None
+    ):
+        """
+        Bulk-loads a DataFrame into PostgreSQL with COPY FROM STDIN.
+
+        The frame is encoded as CSV into an in-memory buffer and copied into a staging
+        table with the column types DataFrame.to_sql would create. Inside the same
+        transaction the staging table then either replaces the target table ('replace',
+        or 'fail' when the target does not exist yet) or is appended to it ('append'), so
+        readers never see a half-loaded table.
+
+        'merge' keeps the target table, with its constraints and indexes: the frame is
+        copied into a temporary table shaped like the target and merged with
+        INSERT ... ON CONFLICT (key) DO UPDATE, which only writes the rows that are new or
+        whose values changed. A new target gets a unique index on `key` so it can be merged
+        into next time, and of rows sharing a key the last one wins.
+
+        Parameters:
+        - engine (sqlalchemy.engine.Engine): Engine for a PostgreSQL database (psycopg2 driver).
+        - table_name (str): Name of the table to which data should be uploaded.
+        - dataframe (pd.DataFrame): The dataframe to be uploaded.
+        - if_exists (str): What to do if the table already exists. Options: 'fail', 'replace', 'append', 'merge'. Default 'fail'.
+        - key (list of str): Columns identifying a row, required for 'merge'. Default None.
+        - dtype (dict): SQLAlchemy types of some columns of a new table, as in DataFrame.to_sql. Default None.
+
+        Raises:
+        - ValueError: If `if_exists` is 'fail' and the table already exists, `if_exists` is not a valid option,
+          or 'merge' is given without a key.
+
+        Returns:
+        -------
+        int or None: rows inserted or changed by 'merge', None otherwise
+        """
+        if if_exists not in ("fail", "replace", "append", "merge"):
+            raise ValueError(f"'{if_exists}' is not valid for if_exists")
+        if if_exists == "merge" and not key:
+            raise ValueError(f"if_exists='{if_exists}' needs the key columns")
+        if if_exists == "merge":
+            # a row may only be merged once per statement
+            duplicated = dataframe.duplicated(key, keep="last")
+            if duplicated.any():
+                dataframe = dataframe[~duplicated]
+
+        buffer = io.StringIO()
+        dataframe.to_csv(buffer, index=False, header=False, na_rep=COPY_NULL)
+        metrics.count_bytes(sent=buffer.tell())
+        buffer.seek(0)
+
+        quote = engine.dialect.identifier_preparer.quote
+        staging_table = f"{table_name}_staging_{uuid.uuid4().hex[:8]}"
+        columns = ", ".join(quote(str(column)) for column in dataframe.columns)
+        create_staging = pd.io.sql.get_schema(
+            dataframe, staging_table, con=engine, dtype=dtype
+        )
+
+        with engine.begin() as connection:
+            exists = sqlalchemy.inspect(connection).has_table(table_name)
+            if exists and if_exists == "fail":
+                raise ValueError(f"Table '{table_name}' already exists.")
+
+            merging = exists and if_exists == "merge"
+            if exists and if_exists in ("append", "merge"):
+                # typed like the target, so COPY casts the values to its column types
+                # and unchanged rows compare equal when merging
+                connection.execute(
+                    sqlalchemy.text(
+                        f"CREATE TEMPORARY TABLE {quote(staging_table)} "
+                        f"(LIKE {quote(table_name)} INCLUDING DEFAULTS) ON COMMIT DROP"
+                    )
+                )
+            else:
+                connection.execute(sqlalchemy.text(create_staging))
+            cursor = connection.connection.cursor()
+            cursor.copy_expert(
+                f"COPY {quote(staging_table)} ({columns}) FROM STDIN "
+                f"WITH (FORMAT csv, NULL '{COPY_NULL}')",
+                buffer,
+            )
+            cursor.close()
+
+            if merging:
+                return DatabaseConnector._merge_from(
+                    connection, quote, staging_table, table_name, dataframe.columns, key
+                )
+
+            if exists and if_exists == "append":
+                connection.execute(
+                    sqlalchemy.text(
+                        f"INSERT INTO {quote(table_name)} ({columns}) "
+                        f"SELECT {columns} FROM {quote(staging_table)}"
+                    )
+                )
+            else:
+                if exists:
+                    DatabaseConnector._drop_foreign_keys_to(
+                        connection, quote, table_name
+                    )
+                connection.execute(
+                    sqlalchemy.text(f"DROP TABLE IF EXISTS {quote(table_name)}")
+                )
+                connection.execute(
+                    sqlalchemy.text(
+                        f"ALTER TABLE {quote(staging_table)} RENAME TO {quote(table_name)}"
+                    )
+                )
+                if if_exists == "merge":
+                    DatabaseConnector._create_key_index(
+                        connection, quote, table_name, key
+                    )
+                    return len(dataframe)
+
+    @staticmethod
+    def _drop_foreign_keys_to(connection, quote, table_name):
+        """Drops the foreign keys of other tables that reference a table about to be replaced."""
+        references = connection.execute(
+            sqlalchemy.text(
+                "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+                "WHERE contype = 'f' AND confrelid = CAST(:table_name AS regclass) "
+                "AND conrelid <> confrelid"
+            ),
+            {"table_name": quote(table_name)},
+        ).fetchall()
+        for referencing_table, constraint in references:
+            connection.execute(
+                sqlalchemy.text(
+                    f"ALTER TABLE {referencing_table} DROP CONSTRAINT {quote(constraint)}"
+                )
+            )
+
+    @staticmethod
+    def _create_key_index(connection, quote, table_name, key):
+        """Creates the unique index on `key` that INSERT ... ON CONFLICT (key) needs."""
+        connection.execute(
+            sqlalchemy.text(
+                f"CREATE UNIQUE INDEX {quote(f'{table_name}_merge_key')} "
+                f"ON {quote(table_name)} ({', '.join(quote(column) for column in key)})"
+            )
+        )
+
+    @staticmethod
+    def _merge_from(connection, quote, staging_table, table_name, columns, key):
+        """
+        Merges a staging table into the target with INSERT ... ON CONFLICT (key) DO UPDATE.
+
+        Rows whose values all equal the target row's are skipped, so only new and changed
+        rows are written. The target needs a unique index or constraint on `key`; one is
+        created if it has none.
+
+        Returns:
+        -------
+        int: rows inserted or changed
+        """
+        inspector = sqlalchemy.inspect(connection)
+        unique_keys = [inspector.get_pk_constraint(table_name)["constrained_columns"]]
+        unique_keys += [
+            constraint["column_names"]
+            for constraint in inspector.get_unique_constraints(table_name)
+        ]
+        unique_keys += [
+            index["column_names"]
+            for index in inspector.get_indexes(table_name)
+            if index["unique"]
+        ]
+        if not any(set(columns) == set(key) for columns in unique_keys):
+            DatabaseConnector._create_key_index(connection, quote, table_name, key)
+
+        column_list = ", ".join(quote(str(column)) for column in columns)
+        values = [quote(str(column)) for column in columns if column not in key]
+        if values:
+            changed = (
+                f"({', '.join(f'target.{column}' for column in values)}) "
+                f"IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in values)})"
+            )
+            on_conflict = (
+                "DO UPDATE SET "
+                + ", ".join(f"{column} = EXCLUDED.{column}" for column in values)
+                + f" WHERE {changed}"
+            )
+        else:
+            on_conflict = "DO NOTHING"
+        key_columns = ", ".join(quote(column) for column in key)
+        result = connection.execute(
+            sqlalchemy.text(
+                f"INSERT INTO {quote(table_name)} AS target ({column_list}) "
+                f"SELECT {column_list} FROM {quote(staging_table)} "
+                f"ON CONFLICT ({key_columns}) {on_conflict}"
+            )
+        )
+        return result.rowcount
+
+
+atexit.register(DatabaseConnector.dispose_engines)
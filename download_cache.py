@@ -0,0 +1,217 @@
+"""
+Local cache for the remote sources (card_details.pdf, products.csv, date_details.json).
+
+Files are stored content-addressed (named by the SHA-256 of their bytes) and indexed by
+URL or S3 bucket/key together with the ETag and Last-Modified the server gave for them.
+A cached source is revalidated with a conditional GET (If-None-Match/If-Modified-Since)
+or an S3 HEAD request, so an unchanged source costs one metadata round-trip instead of a
+full transfer. Writes go to a temporary file that is renamed into place, and the least
+recently used files are evicted once the cache grows past its size limit.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import metrics
+
+# shared by every DownloadCache, so threads using separate instances don't lose index updates
+_index_lock = threading.Lock()
+
+
+class DownloadCache:
+    """Size-bounded, content-addressed download cache."""
+
+    def __init__(self, cache_dir=".cache/downloads", max_bytes=512 * 1024 * 1024):
+        """Initialize DownloadCache.
+
+        Args:
+            cache_dir (str, optional): Directory holding the cached files and their index. Defaults to ".cache/downloads".
+            max_bytes (int, optional): Size above which least recently used files are evicted. Defaults to 512 MiB.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def fetch_url(self, url, headers=None, session=None, timeout=60):
+        """
+        Returns a local path holding the content of a URL, downloading it only if it changed.
+
+        Args:
+            url (str): URL of the file.
+            headers (dict, optional): Extra HTTP headers for the request. Defaults to None.
+            session (requests.Session, optional): Session to send the request with. Defaults to None.
+            timeout (float, optional): Request timeout in seconds. Defaults to 60.
+
+        Raises:
+            requests.HTTPError: If the server answers with an error status.
+
+        Returns:
+            str: Path of the cached file.
+        """
+        entry = self._cached_entry(url)
+        headers = dict(headers or {})
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        if session is None:
+            import requests
+
+            session = requests
+        with session.get(url, headers=headers, stream=True, timeout=timeout) as r:
+            if r.status_code == 304 and entry is not None:
+                return self._touch(url)
+            r.raise_for_status()
+            digest, tmp_path = self._write_temp(r.iter_content(chunk_size=1024 * 1024))
+            return self._store(
+                url,
+                digest,
+                tmp_path,
+                etag=r.headers.get("ETag"),
+                last_modified=r.headers.get("Last-Modified"),
+                suffix=os.path.splitext(url.split("?")[0])[1],
+            )
+
+    def fetch_s3(self, bucket_name, file_key, s3_client=None):
+        """
+        Returns a local path holding an S3 object, downloading it only if its ETag changed.
+
+        Args:
+            bucket_name (str): S3 bucket.
+            file_key (str): Key of the object in the bucket.
+            s3_client (optional): boto3 S3 client. Defaults to a new boto3.client("s3").
+
+        Returns:
+            str: Path of the cached file.
+        """
+        if s3_client is None:
+            import boto3
+
+            s3_client = boto3.client("s3")
+
+        cache_key = f"s3://{bucket_name}/{file_key}"
+        head = s3_client.head_object(Bucket=bucket_name, Key=file_key)
+        etag = head.get("ETag")
+        entry = self._cached_entry(cache_key)
+        if entry is not None and etag and entry.get("etag") == etag:
+            return self._touch(cache_key)
+
+        body = s3_client.get_object(Bucket=bucket_name, Key=file_key)["Body"]
+        digest, tmp_path = self._write_temp(body.iter_chunks(chunk_size=1024 * 1024))
+        last_modified = head.get("LastModified")
+        return self._store(
+            cache_key,
+            digest,
+            tmp_path,
+            etag=etag,
+            last_modified=last_modified.isoformat() if last_modified else None,
+            suffix=os.path.splitext(file_key)[1],
+        )
+
+    def _read_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path, "r") as f:
+            return json.load(f)
+
+    def _write_index(self, index):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def _object_path(self, filename):
+        return os.path.join(self.objects_dir, filename)
+
+    def _cached_entry(self, cache_key):
+        """The index entry for a key, if its file is still present."""
+        with _index_lock:
+            entry = self._read_index().get(cache_key)
+        if entry is None or not os.path.exists(self._object_path(entry["filename"])):
+            return None
+        return entry
+
+    def _touch(self, cache_key):
+        with _index_lock:
+            index = self._read_index()
+            index[cache_key]["last_access"] = time.time()
+            self._write_index(index)
+        return self._object_path(index[cache_key]["filename"])
+
+    def _write_temp(self, chunks):
+        """Streams chunks into a temporary file in the cache directory, hashing them on the way."""
+        sha256 = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    sha256.update(chunk)
+                    f.write(chunk)
+                    metrics.count_bytes(received=len(chunk))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return sha256.hexdigest(), tmp_path
+
+    def _store(self, cache_key, digest, tmp_path, etag, last_modified, suffix=""):
+        filename = f"{digest}{suffix}"
+        path = self._object_path(filename)
+        with _index_lock:
+            # identical content is already stored under another key or an earlier version
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+            index = self._read_index()
+            previous = index.get(cache_key)
+            index[cache_key] = {
+                "filename": filename,
+                "sha256": digest,
+                "etag": etag,
+                "last_modified": last_modified,
+                "size": os.path.getsize(path),
+                "last_access": time.time(),
+            }
+            if previous is not None and previous["filename"] != filename:
+                self._remove_unreferenced(index, previous["filename"])
+            self._evict(index, keep=cache_key)
+            self._write_index(index)
+        return path
+
+    def _evict(self, index, keep):
+        """Drops least recently used entries until the cached files fit in max_bytes."""
+        # entries whose file disappeared are dropped first
+        for cache_key in [
+            k
+            for k, v in index.items()
+            if not os.path.exists(self._object_path(v["filename"]))
+        ]:
+            del index[cache_key]
+
+        sizes = {entry["filename"]: entry["size"] for entry in index.values()}
+        total = sum(sizes.values())
+        by_age = sorted(index.items(), key=lambda item: item[1]["last_access"])
+        for cache_key, entry in by_age:
+            if total <= self.max_bytes:
+                break
+            if cache_key == keep:
+                continue
+            del index[cache_key]
+            if self._remove_unreferenced(index, entry["filename"]):
+                total -= sizes[entry["filename"]]
+
+    def _remove_unreferenced(self, index, filename):
+        """Deletes a cached file once no index entry refers to it. Returns True if it was deleted."""
+        if any(entry["filename"] == filename for entry in index.values()):
+            return False
+        if os.path.exists(self._object_path(filename)):
+            os.remove(self._object_path(filename))
+        return True
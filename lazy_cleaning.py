@@ -0,0 +1,205 @@
+"""
+Out-of-core cleaning with pyarrow datasets.
+
+The pandas cleaning methods need the whole table in memory. Here a table is read as a
+pyarrow dataset (a Parquet or CSV file, or a directory of them) and cleaned while it is
+scanned: dropped columns are never read, and the row filters are Arrow expressions pushed
+down into the scanner, which reads and filters the batches on all cores. The cleaned
+batches are streamed into a Parquet file, so memory use depends on the batch size rather
+than on the size of the table.
+
+Every part of a raw table is written with one schema, that of its RDS table (see
+`arrow_schema`), and the dataset is scanned with that schema. A column that is all NULL
+in one chunk is then still text there, not Arrow's null type.
+
+`clean_orders_dataset` gives the same rows and columns as DataCleaning.clean_orders_data.
+"""
+
+import os
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import sqlalchemy
+
+import database_utils
+import schema
+import transformations
+
+ORDERS_DROP_COLUMNS = ("level_0", "index", "1", "first_name", "last_name")
+
+
+def arrow_schema(table):
+    """
+    Arrow schema of the frames pd.read_sql_table reads from a table, for `write_chunks`.
+
+    The types follow the column types, as in DataExtractor._harmonize_dtypes: integers are
+    int64 (chunks that read them as float64 because of NULLs convert back exactly), floats
+    and numerics float64, booleans bool, dates and timestamps timestamp[ns], times time64
+    and anything else text.
+
+    Args:
+        table (sqlalchemy.Table): reflected table, e.g. from DataExtractor.reflect_rds_table
+
+    Returns:
+        pa.Schema: one field per column of the table
+    """
+    fields = []
+    for column in table.columns:
+        if isinstance(column.type, sqlalchemy.Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column.type, sqlalchemy.Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, sqlalchemy.Numeric):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, sqlalchemy.DateTime):
+            arrow_type = pa.timestamp("ns", tz="UTC" if column.type.timezone else None)
+        elif isinstance(column.type, sqlalchemy.Date):
+            arrow_type = pa.timestamp("ns")
+        elif isinstance(column.type, sqlalchemy.Time):
+            arrow_type = pa.time64("us")
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def write_chunks(chunks, directory, schema):
+    """
+    Writes DataFrame chunks to a directory of Parquet files, one file per chunk, all with the same schema.
+
+    Args:
+        chunks (Iterator[pd.DataFrame]): e.g. from DataExtractor.stream_rds_table
+        directory (str): destination directory, created if needed
+        schema (pa.Schema): schema of every file, e.g. from `arrow_schema`. Inferring it from
+            the chunks would type a column that has no values in a chunk as null there.
+
+    Raises:
+        pa.ArrowInvalid: If a chunk does not convert to the schema.
+
+    Returns:
+        int: number of rows written
+    """
+    os.makedirs(directory, exist_ok=True)
+    rows = 0
+    for i, chunk in enumerate(chunks):
+        table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+        pq.write_table(table, os.path.join(directory, f"part-{i:05d}.parquet"))
+        rows += len(chunk)
+    return rows
+
+
+def clean_dataset(
+    source,
+    destination,
+    drop_columns=(),
+    dropna_subset=None,
+    drop_upper_or_numeric_rows=False,
+    source_format="parquet",
+    batch_size=128 * 1024,
+    schema=None,
+):
+    """
+    Streams a dataset through column drops and row filters into a Parquet file.
+
+    Args:
+        source (str): Parquet or CSV file, or a directory of them
+        destination (str): Parquet file to write
+        drop_columns (tuple of str, optional): columns to drop. Every one must exist. Defaults to ().
+        dropna_subset (list of str, optional): drop the rows missing a value in any of these columns. Defaults to None.
+        drop_upper_or_numeric_rows (bool, optional): drop the rows whose kept columns are all upper case
+            or numeric, see `transformations.upper_or_numeric_rows_expression`. Defaults to False.
+        source_format (str, optional): "parquet" or "csv". Defaults to "parquet".
+        batch_size (int, optional): rows per scanned batch. Defaults to 131072.
+        schema (pa.Schema, optional): schema the files are read with, e.g. the one `write_chunks`
+            wrote them with. Defaults to the schema of the first file.
+
+    Raises:
+        KeyError: If a column to drop is not in the dataset.
+
+    Returns:
+        int: number of rows written
+    """
+    dataset = ds.dataset(source, format=source_format, schema=schema)
+    missing = [name for name in drop_columns if name not in dataset.schema.names]
+    if missing:
+        raise KeyError(f"{missing} not found in axis")
+    columns = [name for name in dataset.schema.names if name not in drop_columns]
+
+    row_filter = None
+    if dropna_subset:
+        row_filter = transformations.notna_expression(dropna_subset)
+    if drop_upper_or_numeric_rows:
+        keep = ~transformations.upper_or_numeric_rows_expression(
+            dataset.schema, columns
+        )
+        row_filter = keep if row_filter is None else row_filter & keep
+
+    scanner = dataset.scanner(
+        columns=columns, filter=row_filter, batch_size=batch_size, use_threads=True
+    )
+    rows = 0
+    with pq.ParquetWriter(destination, scanner.projected_schema) as writer:
+        for batch in scanner.to_batches():
+            if batch.num_rows:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    return rows
+
+
+def clean_orders_dataset(source, destination, source_format="parquet", schema=None):
+    """
+    Out-of-core DataCleaning.clean_orders_data: drops the redundant columns and the rows without a card number.
+
+    Args:
+        source (str): raw orders_table as a Parquet or CSV file, or a directory of them
+        destination (str): Parquet file to write the cleaned table to
+        source_format (str, optional): "parquet" or "csv". Defaults to "parquet".
+        schema (pa.Schema, optional): see `clean_dataset`. Defaults to None.
+
+    Returns:
+        int: number of rows written
+    """
+    return clean_dataset(
+        source,
+        destination,
+        drop_columns=ORDERS_DROP_COLUMNS,
+        dropna_subset=["card_number"],
+        source_format=source_format,
+        schema=schema,
+    )
+
+
+def upload_parquet(path, table_name, batch_size=128 * 1024, if_exists="fail", key=None):
+    """
+    Uploads a Parquet file to the database one batch at a time.
+
+    Every batch is loaded with the table's declared types by schema.load, and the keys
+    and indexes are added once, after the last batch.
+
+    Args:
+        path (str): Parquet file, e.g. written by `clean_dataset`
+        table_name (str): destination table name
+        batch_size (int, optional): rows per uploaded batch. Defaults to 131072.
+        if_exists (str, optional): applied to the first batch, the others are appended,
+            or merged with 'merge'. Defaults to "fail".
+        key (list of str, optional): key columns for 'merge'. Defaults to None.
+
+    Returns:
+        int: number of rows uploaded
+    """
+    dc = database_utils.DatabaseConnector()
+    rows = 0
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        schema.load(
+            table_name,
+            batch.to_pandas(),
+            if_exists=if_exists,
+            key=key,
+            db_connector=dc,
+            constraints=False,
+        )
+        if_exists = "merge" if if_exists == "merge" else "append"
+        rows += batch.num_rows
+    schema.constrain(table_name, dc)
+    return rows
@@ -1,20 +1,156 @@
-import data_cleaning
-import data_extraction
-import database_utils
+"""
+Main script to execute ETL (Extract, Transform, Load) tasks for different types of data.
+
+The pipeline modules, and with them pandas, SQLAlchemy, boto3 and tabula, are only imported
+once the arguments are parsed, so `--help` and argument errors return at once.
+"""
+
 import argparse
 import os
-import pandas as pd
+import pstats
+import tempfile
 
+import metrics
 
-"""
-Main script to execute ETL (Extract, Transform, Load) tasks for different types of data.
-"""
+# RDS tables that can be streamed in chunks with --chunksize or --partitions
+CHUNKED_SOURCES = {"user": "legacy_users", "order": "orders_table"}
+
+
+def upload_in_chunks(chunks, name, recorder, dq_metrics=True, if_exists="fail"):
+    """
+    Cleans and uploads a table one chunk at a time.
+
+    Every chunk is loaded with the table's declared types by schema.load. The first chunk
+    is loaded with `if_exists` and every following chunk is appended (or merged) to it, so
+    only one chunk is held in memory at a time; the keys and indexes are added once,
+    after the last chunk.
+
+    Args:
+        chunks (Iterator[pd.DataFrame]): Raw chunks, e.g. from DataExtractor.stream_rds_table
+            or DataExtractor.stream_rds_partitions.
+        name (str): Pipeline name, a key of pipeline.PIPELINES.
+        recorder (metrics.MetricsRecorder): Records the clean and load stage of every chunk.
+        dq_metrics (bool, optional): Profile every chunk and its cleaned rows and append the
+            profile of the whole table to dq_metrics at the end. Defaults to True.
+        if_exists (str, optional): 'fail', 'replace' or 'merge', for the first chunk, see
+            pipeline.run_pipeline. Defaults to "fail".
+    """
+    import data_quality
+    import database_utils
+    import pipeline
+    import schema
+
+    table_pipeline = pipeline.PIPELINES[name]
+    dc = database_utils.DatabaseConnector()
+    quality = data_quality.Profile() if dq_metrics else None
+    for chunk in chunks:
+
+        def clean():
+            cleaned, chunk_quality = data_quality.clean_and_profile(
+                table_pipeline.clean, chunk, quality is not None
+            )
+            if quality is not None:
+                quality.merge(chunk_quality)
+            return cleaned
+
+        cleaned = recorder.time(name, "clean", clean, rows_in=len(chunk))
+        recorder.time(
+            name,
+            "load",
+            lambda: schema.load(
+                table_pipeline.table_name,
+                cleaned,
+                if_exists=if_exists,
+                key=table_pipeline.key,
+                db_connector=dc,
+                constraints=False,
+            ),
+            rows_in=len(cleaned),
+            rows=len(cleaned),
+        )
+        if_exists = "merge" if if_exists == "merge" else "append"
+    recorder.time(
+        name, "constrain", lambda: schema.constrain(table_pipeline.table_name, dc)
+    )
+
+    if quality is not None:
+        cleans = [
+            record
+            for record in recorder.records
+            if record.pipeline == name and record.stage == "clean"
+        ]
+        rejected = {}
+        for record in cleans:
+            for rule, rows in record.dropped.items():
+                rejected[rule] = rejected.get(rule, 0) + rows
+        recorder.time(
+            name,
+            "dq",
+            lambda: data_quality.write_metrics(
+                table_pipeline.table_name,
+                quality,
+                sum(record.rows_in for record in cleans),
+                rejected,
+            ),
+        )
+
+
+def clean_orders_out_of_core(recorder, chunksize=None, if_exists="fail"):
+    """
+    Extracts, cleans and uploads orders_table without holding it in memory.
+
+    The table is streamed from RDS into Parquet files in a temporary directory, cleaned
+    there by lazy_cleaning.clean_orders_dataset and uploaded batch by batch.
+
+    Args:
+        recorder (metrics.MetricsRecorder): Records the extract, clean and load stages.
+        chunksize (int, optional): Rows per streamed chunk. Defaults to 50000.
+        if_exists (str, optional): see lazy_cleaning.upload_parquet. Defaults to "fail".
+    """
+    import data_extraction
+    import lazy_cleaning
+    import pipeline
+
+    de = data_extraction.DataExtractor()
+    # one schema for every chunk, so a column that is all NULL in one chunk keeps its type
+    schema = lazy_cleaning.arrow_schema(de.reflect_rds_table("orders_table"))
+    with tempfile.TemporaryDirectory(prefix="orders_") as work_dir:
+        raw_dir = os.path.join(work_dir, "raw")
+        cleaned_path = os.path.join(work_dir, "orders_table.parquet")
+        rows = recorder.time(
+            "order",
+            "extract",
+            lambda: lazy_cleaning.write_chunks(
+                de.stream_rds_table("orders_table", chunksize or 50000),
+                raw_dir,
+                schema,
+            ),
+        )
+        cleaned_rows = recorder.time(
+            "order",
+            "clean",
+            lambda: lazy_cleaning.clean_orders_dataset(
+                raw_dir, cleaned_path, schema=schema
+            ),
+            rows_in=rows,
+        )
+        recorder.time(
+            "order",
+            "load",
+            lambda: lazy_cleaning.upload_parquet(
+                cleaned_path,
+                "orders_table",
+                if_exists=if_exists,
+                key=pipeline.PIPELINES["order"].key,
+            ),
+            rows_in=cleaned_rows,
+        )
 
-api_key = os.environ.get("API_KEY")
-if api_key is None:
-    input("enter your S3")
 
-headers = {"x-api-key": api_key}
+def print_profile(path, limit=25):
+    """Prints the functions with the highest cumulative time from a cProfile dump."""
+    print(f"cProfile stats in {path}:")
+    pstats.Stats(path).sort_stats("cumulative").print_stats(limit)
 
 
 def main():
@@ -29,65 +165,221 @@ def main():
     parser.add_argument(
         "type",
         type=str,
-        choices=["user", "card", "store", "product", "order", "date_event"],
-        help="""The type of data to clean:
+        nargs="+",
+        choices=["user", "card", "store", "product", "order", "date_event", "all"],
+        help="""The type(s) of data to clean. Several types, or all, run concurrently:
                                 - user: Cleans user data by removing duplicates, formatting dates, etc.
                                 - card: Cleans card data, validates card numbers, etc.
                                 - store: Cleans store data, removes redundant columns, etc.
                                 - product: Cleans product data, standardizes weight units, etc.
                                 - order: Cleans order data, removes incomplete rows, etc.
-                                - date_event: Cleans date event data, combines date and time fields, etc.""",
+                                - date_event: Cleans date event data, combines date and time fields, etc.
+                                - all: Runs every pipeline, loading orders after the dimension tables.""",
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="Stream the RDS tables (user, order) in chunks of this many rows instead of loading them whole.",
+    )
 
-    if args.type == "user":
-        de = data_extraction.DataExtractor()
-        data = de.read_rds_table("legacy_users")
-        cleaned_data = data_cleaning.DataCleaning.clean_user_data(data)
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        default=None,
+        help="Read the RDS tables (user, order) as this many key-range slices over concurrent connections, cleaning and uploading each slice as it arrives.",
+    )
 
-        dc = database_utils.DatabaseConnector()
-        dc.upload_to_db("dim_users_table", cleaned_data)
-        print("The script ran without error, check postgres for the table")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only extract the rows added since the last run (user, order), tracked in etl_state.json, and merge them into the table on its key.",
+    )
 
-    if args.type == "card":
-        de = data_extraction.DataExtractor()
-        data = de.retrieve_pdf_data(
-            "https://data-handling-public.s3.eu-west-1.amazonaws.com/card_details.pdf"
+    parser.add_argument(
+        "--if-exists",
+        choices=["fail", "replace", "merge"],
+        default="fail",
+        help="What to do when a table already exists: fail, replace it, or merge the cleaned rows into it on its key (user_uuid, card_number, store_code, product_code, date_uuid; orders_table on date_uuid), keeping its constraints and indexes and only writing changed rows.",
+    )
+
+    parser.add_argument(
+        "--no-aggregates",
+        action="store_true",
+        help="Do not refresh the BI aggregate tables (see aggregates.py) after loading orders or the store, product and date dimensions.",
+    )
+
+    parser.add_argument(
+        "--no-dq-metrics",
+        action="store_true",
+        help="Do not profile the tables (missing, 'NULL' and 'N/A' values before cleaning, distinct counts and min/max after, rows rejected per rule) into the dq_metrics table.",
+    )
+
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Downcast the cleaned frames (Arrow strings, categoricals, small integers, floats that fit float32 exactly) before loading and report their memory use. Whole tables only: not with --lazy, --incremental, or --chunksize and --partitions on user and order.",
+    )
+
+    parser.add_argument(
+        "--metrics",
+        choices=["table", "jsonl", "prometheus"],
+        default="table",
+        help="Format of the per-stage metrics (time, rows, rows dropped, bytes downloaded and uploaded, and the RSS high-water mark of the process that ran the stage).",
+    )
+
+    parser.add_argument(
+        "--metrics-file",
+        default=None,
+        help="Write the metrics to this file instead of stdout (JSON lines are appended).",
+    )
+
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="clean",
+        default=None,
+        choices=["extract", "clean", "compact", "load"],
+        help="Run a stage (default: clean) under cProfile, dump the stats to profile_<type>_<stage>.prof and print the top functions.",
+    )
+
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="Clean orders_table out of core: stream it to Parquet and clean it with pyarrow, for tables larger than RAM.",
+    )
+
+    parser.add_argument(
+        "--stage",
+        action="store_true",
+        help="Keep every run's raw extracts and cleaned tables in the staging area, to resume from with --from-stage.",
+    )
+
+    parser.add_argument(
+        "--from-stage",
+        choices=["extract", "clean", "load"],  # pipeline.STAGES
+        default="extract",
+        help="Resume from the staged raw extract (clean) or the staged cleaned table (load) of an earlier --stage run instead of extracting again.",
+    )
+
+    parser.add_argument(
+        "--stage-dir",
+        default=".stage",
+        help="Directory of the staging area. Default .stage.",
+    )
+
+    args = parser.parse_args()
+
+    import aggregates
+    import data_extraction
+    import incremental
+    import pipeline
+    import staging
+
+    recorder = metrics.MetricsRecorder()
+    if args.from_stage != "extract" and (
+        args.incremental or args.lazy or args.chunksize or args.partitions
+    ):
+        parser.error(
+            "--from-stage cannot be combined with --incremental, --lazy, --chunksize or --partitions"
+        )
+    if args.compact and (
+        args.lazy
+        or args.incremental
+        or (
+            (args.chunksize or args.partitions)
+            and set(args.type) & set(CHUNKED_SOURCES)
         )
-        cleaned_data = data_cleaning.DataCleaning.clean_card_data(data)
-        dc = database_utils.DatabaseConnector()
-        dc.upload_to_db("dim_cards", cleaned_data)
-        print("The script ran without error, check postgres for the table")
-
-    if args.type == "store":
-        data = data_extraction.DataExtractor.retrieve_stores_data()
-        cleaned_data = data_cleaning.DataCleaning.clean_store_data(data)
-        dc = database_utils.DatabaseConnector()
-        dc.upload_to_db("dim_stores", cleaned_data)
-        print("The script ran without error, check postgres for the table")
-
-    if args.type == "product":
-        data = data_extraction.DataExtractor.extract_from_s3()
-        cleaned_data = data_cleaning.DataCleaning.clean_product_data(data)
-        dc = database_utils.DatabaseConnector()
-        dc.upload_to_db("dim_products", cleaned_data)
-        print("The script ran without error, check postgres for the table")
-
-    if args.type == "order":
-        de = data_extraction.DataExtractor()
-        data = de.read_rds_table("orders_table")
-        cleaned_data = data_cleaning.DataCleaning.clean_orders_data(data)
-        dc = database_utils.DatabaseConnector()
-        dc.upload_to_db("orders_table", cleaned_data)
-        print("The script ran without error, check postgres for the table")
-
-    if args.type == "date_event":
-        data = data_extraction.DataExtractor.extract_json_from_URL()
-        cleaned_data = data_cleaning.DataCleaning.clean_date_events(data)
-        dc = database_utils.DatabaseConnector()
-        dc.upload_to_db("dim_date_times", cleaned_data)
-        print("The script ran without error, check postgres for the table")
+    ):
+        # chunks downcast on their own could disagree on the integer and float widths
+        parser.error(
+            "--compact cannot be combined with --lazy, --incremental, or --chunksize and --partitions on user and order, which load chunk by chunk"
+        )
+    options = {
+        "if_exists": args.if_exists,
+        "compact": args.compact,
+        "profile_stage": args.profile,
+        # resuming reads the staging area, and stages what it cleans again
+        "staging_area": (
+            staging.StagingArea(args.stage_dir)
+            if args.stage or args.from_stage != "extract"
+            else None
+        ),
+        "from_stage": args.from_stage,
+        "dq_metrics": not args.no_dq_metrics,
+    }
+
+    if "all" in args.type or len(set(args.type)) > 1:
+        if args.chunksize or args.partitions or args.incremental or args.lazy:
+            parser.error(
+                "--chunksize, --partitions, --incremental and --lazy run a single type"
+            )
+        names = list(pipeline.PIPELINES) if "all" in args.type else args.type
+        recorder, errors = pipeline.run_pipelines(names, recorder=recorder, **options)
+    else:
+        name = args.type[0]
+        names = [name]
+        errors = {}
+        if args.incremental:
+            if name not in incremental.INCREMENTAL_TABLES:
+                parser.error(
+                    f"--incremental supports {', '.join(incremental.INCREMENTAL_TABLES)}"
+                )
+            loaded = incremental.run_incremental(
+                name,
+                chunksize=args.chunksize,
+                refresh_aggregates=not args.no_aggregates,
+            )
+            print(f"The script ran without error, {loaded} new rows loaded")
+            return
+        if args.lazy:
+            if name != "order":
+                parser.error("--lazy supports order")
+            clean_orders_out_of_core(recorder, args.chunksize, args.if_exists)
+        elif args.partitions and name in CHUNKED_SOURCES:
+            de = data_extraction.DataExtractor()
+            upload_in_chunks(
+                de.stream_rds_partitions(CHUNKED_SOURCES[name], args.partitions),
+                name,
+                recorder,
+                dq_metrics=not args.no_dq_metrics,
+                if_exists=args.if_exists,
+            )
+        elif args.chunksize and name in CHUNKED_SOURCES:
+            de = data_extraction.DataExtractor()
+            upload_in_chunks(
+                de.stream_rds_table(CHUNKED_SOURCES[name], args.chunksize),
+                name,
+                recorder,
+                dq_metrics=not args.no_dq_metrics,
+                if_exists=args.if_exists,
+            )
+        else:
+            pipeline.run_pipeline(name, recorder, **options)
+
+    if not args.no_aggregates and any(
+        name in aggregates.SOURCES and name not in errors for name in names
+    ):
+        try:
+            recorder.time(
+                "aggregates",
+                "refresh",
+                lambda: sum(aggregates.refresh().values()),
+            )
+        except Exception as error:
+            errors["aggregates"] = error
+
+    recorder.write(args.metrics, args.metrics_file)
+    if args.profile:
+        for name in names:
+            path = pipeline.profile_path(name, args.profile)
+            if name not in errors and os.path.exists(path):
+                print_profile(path)
+    for name, error in errors.items():
+        print(f"The {name} pipeline failed: {error!r}")
+    if not errors:
+        print("The script ran without error, check postgres for the tables")
 
 
 if __name__ == "__main__":
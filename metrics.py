@@ -0,0 +1,346 @@
+"""
+Per-stage metrics for the ETL pipelines.
+
+Every extract, clean, compact and load stage is recorded with its wall time, its rows in
+and out, the rows dropped by each row-filtering transformation, the bytes it transferred
+and the RSS high-water mark of the process that ran it. That high-water mark is the
+largest RSS the process has had since it started, so it covers every stage the process
+ran before as well: the largest one is the run's peak, not a stage's own peak. The
+records can be printed as a table or written as JSON lines or in the Prometheus text
+format.
+
+Rows dropped and bytes transferred are reported from inside the stage: the row filters of
+the cleaning specs and the transformations decorated with `counts_dropped_rows` report the
+rows they drop through `count_dropped`, and the extractors and loaders call `count_bytes`
+with the bytes they download and upload. Work handed to another thread reports to the
+stage that handed it over if it is wrapped with `bind`.
+"""
+
+import cProfile
+import functools
+import json
+import sys
+import threading
+import time
+from collections import namedtuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+Measurement = namedtuple(
+    "Measurement",
+    ["seconds", "process_max_rss_bytes", "bytes_in", "bytes_out", "dropped"],
+)
+
+StageRecord = namedtuple(
+    "StageRecord",
+    [
+        "pipeline",
+        "stage",
+        "seconds",
+        "rows_in",
+        "rows_out",
+        "dropped",
+        "process_max_rss_bytes",
+        "bytes_in",
+        "bytes_out",
+    ],
+)
+
+
+class _StageCounters:
+    """Rows dropped and bytes transferred by one stage, added to from any thread."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dropped = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+
+# counters of the stage being measured on the current thread
+_active = threading.local()
+
+
+def _current():
+    return getattr(_active, "counters", None)
+
+
+def _process_max_rss_bytes():
+    # ru_maxrss is the high-water mark since the process started, not the peak of one stage
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def count_bytes(received=0, sent=0):
+    """Adds bytes downloaded and uploaded to the stage measured on the calling thread, if any."""
+    counters = _current()
+    if counters is None:
+        return
+    with counters.lock:
+        counters.bytes_in += received
+        counters.bytes_out += sent
+
+
+def count_dropped(rule, rows):
+    """Adds rows dropped by a rule to the stage measured on the calling thread, if any."""
+    counters = _current()
+    if counters is None:
+        return
+    with counters.lock:
+        counters.dropped[rule] = counters.dropped.get(rule, 0) + rows
+
+
+def bind(func):
+    """
+    Wraps func so it reports to the stage measured on the calling thread, wherever it runs.
+
+    Use it on work submitted to a thread pool from inside a stage.
+    """
+    counters = _current()
+    if counters is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = _current()
+        _active.counters = counters
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _active.counters = previous
+
+    return wrapper
+
+
+def counts_dropped_rows(func):
+    """
+    Decorator for transformations that take a DataFrame and return it with rows removed.
+
+    The rows each call drops are added, under the function's name, to the stage being
+    measured on the calling thread. Outside a measured stage the function runs unchanged.
+    """
+
+    @functools.wraps(func)
+    def wrapper(df, *args, **kwargs):
+        result = func(df, *args, **kwargs)
+        count_dropped(func.__name__, len(df) - len(result))
+        return result
+
+    return wrapper
+
+
+def measure(func, *args, profile_path=None):
+    """
+    Calls func(*args) and measures it in the calling thread and process.
+
+    Being a module-level function, it can be submitted to a process pool so the
+    measurement is taken in the worker process.
+
+    Args:
+        func (callable): the stage
+        *args: arguments for func
+        profile_path (str, optional): run func under cProfile and dump the stats to this file. Defaults to None.
+
+    Returns:
+        tuple: (result of func, Measurement)
+    """
+    previous = _current()
+    _active.counters = counters = _StageCounters()
+    start = time.perf_counter()
+    try:
+        if profile_path:
+            profiler = cProfile.Profile()
+            result = profiler.runcall(func, *args)
+            profiler.dump_stats(profile_path)
+        else:
+            result = func(*args)
+    finally:
+        _active.counters = previous
+    seconds = time.perf_counter() - start
+    return result, Measurement(
+        seconds,
+        _process_max_rss_bytes(),
+        counters.bytes_in,
+        counters.bytes_out,
+        counters.dropped,
+    )
+
+
+class MetricsRecorder:
+    """Collects StageRecords from the scheduler's worker threads."""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def time(
+        self, pipeline_name, stage, func, rows_in=None, rows=None, profile_path=None
+    ):
+        """
+        Calls func() and records it as a stage.
+
+        Args:
+            pipeline_name (str): pipeline the stage belongs to
+            stage (str): stage name, e.g. 'extract'
+            func (callable): the stage, called without arguments
+            rows_in (int, optional): rows going into the stage. Defaults to None.
+            rows (int, optional): rows coming out of the stage. Defaults to the length of its result,
+                or the result itself if it is an int (a row count).
+            profile_path (str, optional): see `measure`. Defaults to None.
+
+        Returns:
+            the result of func()
+        """
+        result, measurement = measure(func, profile_path=profile_path)
+        if rows is None and hasattr(result, "__len__"):
+            rows = len(result)
+        elif rows is None and isinstance(result, int):
+            rows = result  # stages that stream their rows return how many there were
+        self.add(pipeline_name, stage, measurement, rows_in, rows)
+        return result
+
+    def add(self, pipeline_name, stage, measurement, rows_in=None, rows_out=None):
+        """
+        Records a stage measured elsewhere, e.g. by `measure` in a worker process.
+
+        Rows removed between rows_in and rows_out that no decorated transformation
+        accounts for are recorded as dropped by 'other'.
+
+        Returns:
+            StageRecord: the record
+        """
+        dropped = dict(measurement.dropped)
+        if rows_in is not None and rows_out is not None:
+            untracked = rows_in - rows_out - sum(dropped.values())
+            if untracked > 0:
+                dropped["other"] = untracked
+        record = StageRecord(
+            pipeline_name,
+            stage,
+            measurement.seconds,
+            rows_in,
+            rows_out,
+            dropped,
+            measurement.process_max_rss_bytes,
+            measurement.bytes_in,
+            measurement.bytes_out,
+        )
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def report(self):
+        """Formats the records as a table, one line per pipeline stage."""
+        lines = [
+            f"{'pipeline':<12}{'stage':<9}{'seconds':>9}{'rows in':>10}{'rows out':>10}"
+            f"{'proc max MiB':>13}{'in MiB':>10}{'out MiB':>10}  dropped"
+        ]
+
+        def mib(n):
+            return "" if n is None else f"{n / 2**20:.1f}"
+
+        for r in self.records:
+            dropped = ", ".join(f"{name}={rows}" for name, rows in r.dropped.items())
+            lines.append(
+                f"{r.pipeline:<12}{r.stage:<9}{r.seconds:>9.2f}"
+                f"{'' if r.rows_in is None else r.rows_in:>10}"
+                f"{'' if r.rows_out is None else r.rows_out:>10}"
+                f"{mib(r.process_max_rss_bytes):>13}{mib(r.bytes_in):>10}"
+                f"{mib(r.bytes_out):>10}  {dropped}"
+            )
+        return "\n".join(lines)
+
+    def to_json_lines(self):
+        """One JSON object per record, one per line."""
+        return "\n".join(json.dumps(r._asdict()) for r in self.records)
+
+    def to_prometheus(self):
+        """
+        The records in the Prometheus text format, e.g. for the node_exporter textfile collector.
+
+        Records of the same pipeline and stage (the chunks of a chunked load) are summed,
+        except for the process RSS high-water mark, which is their maximum.
+        """
+        totals = {}
+        for r in self.records:
+            key = (r.pipeline, r.stage)
+            total = totals.setdefault(key, {"dropped": {}})
+            for field in (
+                "seconds",
+                "rows_in",
+                "rows_out",
+                "bytes_in",
+                "bytes_out",
+            ):
+                value = getattr(r, field)
+                if value is not None:
+                    total[field] = total.get(field, 0) + value
+            if r.process_max_rss_bytes is not None:
+                total["process_max_rss_bytes"] = max(
+                    total.get("process_max_rss_bytes", 0), r.process_max_rss_bytes
+                )
+            for name, rows in r.dropped.items():
+                total["dropped"][name] = total["dropped"].get(name, 0) + rows
+
+        gauges = [
+            ("seconds", "etl_stage_seconds", "Wall time of the stage."),
+            ("rows_in", "etl_stage_rows_in", "Rows going into the stage."),
+            ("rows_out", "etl_stage_rows_out", "Rows coming out of the stage."),
+            (
+                "process_max_rss_bytes",
+                "etl_process_max_rss_bytes",
+                "RSS high-water mark of the process that ran the stage, since the process started.",
+            ),
+            (
+                "bytes_in",
+                "etl_stage_received_bytes",
+                "Bytes downloaded by the stage.",
+            ),
+            (
+                "bytes_out",
+                "etl_stage_sent_bytes",
+                "Bytes uploaded by the stage.",
+            ),
+        ]
+        lines = []
+        for field, metric, help_text in gauges:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+            for (pipeline_name, stage), total in totals.items():
+                if field in total:
+                    labels = f'pipeline="{pipeline_name}",stage="{stage}"'
+                    lines.append(f"{metric}{{{labels}}} {total[field]}")
+        metric = "etl_stage_rows_dropped"
+        lines += [
+            f"# HELP {metric} Rows dropped during the stage, by transformation.",
+            f"# TYPE {metric} gauge",
+        ]
+        for (pipeline_name, stage), total in totals.items():
+            for name, rows in total["dropped"].items():
+                labels = f'pipeline="{pipeline_name}",stage="{stage}",transformation="{name}"'
+                lines.append(f"{metric}{{{labels}}} {rows}")
+        return "\n".join(lines)
+
+    def write(self, fmt="table", path=None):
+        """
+        Writes the records as a 'table', 'jsonl' or 'prometheus'.
+
+        Args:
+            fmt (str, optional): output format. Defaults to "table".
+            path (str, optional): file to write; JSON lines are appended to it, the other formats replace it. Defaults to stdout.
+        """
+        text = {
+            "table": self.report,
+            "jsonl": self.to_json_lines,
+            "prometheus": self.to_prometheus,
+        }[fmt]()
+        if path is None:
+            print(text)
+            return
+        with open(path, "a" if fmt == "jsonl" else "w") as f:
+            f.write(text + "\n")
@@ -0,0 +1,331 @@
+"""
+Pipeline definitions and a dependency-aware scheduler for running several tables at once.
+
+Each pipeline is extract -> clean -> load for one table. Extractions are network-bound and
+run in a thread pool, cleaning is CPU-bound and runs in a process pool, and a pipeline only
+loads once every pipeline it depends on has loaded (orders_table after the dimension tables
+it references).
+"""
+
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import data_cleaning
+import data_extraction
+import data_quality
+import metrics
+import schema
+import transformations
+
+# key: columns identifying a row of the target table, which if_exists="merge" merges on
+Pipeline = namedtuple(
+    "Pipeline",
+    ["name", "extract", "clean", "table_name", "depends_on", "key"],
+    defaults=(None,),
+)
+
+DIMENSIONS = ("user", "card", "store", "product", "date_event")
+
+# key-range slices the RDS tables are read in concurrently, see DataExtractor.read_rds_table_partitioned
+RDS_PARTITIONS = 4
+
+PIPELINES = {
+    "user": Pipeline(
+        "user",
+        lambda: data_extraction.DataExtractor().read_rds_table(
+            "legacy_users", partitions=RDS_PARTITIONS
+        ),
+        data_cleaning.DataCleaning.clean_user_data,
+        "dim_users_table",
+        (),
+        ["user_uuid"],
+    ),
+    "card": Pipeline(
+        "card",
+        lambda: data_extraction.DataExtractor.retrieve_pdf_data(
+            "https://data-handling-public.s3.eu-west-1.amazonaws.com/card_details.pdf"
+        ),
+        data_cleaning.DataCleaning.clean_card_data,
+        "dim_cards",
+        (),
+        ["card_number"],
+    ),
+    "store": Pipeline(
+        "store",
+        lambda: data_extraction.DataExtractor.retrieve_stores_data(),
+        data_cleaning.DataCleaning.clean_store_data,
+        "dim_stores",
+        (),
+        ["store_code"],
+    ),
+    "product": Pipeline(
+        "product",
+        lambda: data_extraction.DataExtractor.extract_from_s3(),
+        data_cleaning.DataCleaning.clean_product_data,
+        "dim_products",
+        (),
+        ["product_code"],
+    ),
+    "order": Pipeline(
+        "order",
+        lambda: data_extraction.DataExtractor().read_rds_table(
+            "orders_table", partitions=RDS_PARTITIONS
+        ),
+        data_cleaning.DataCleaning.clean_orders_data,
+        "orders_table",
+        DIMENSIONS,
+        ["date_uuid"],
+    ),
+    "date_event": Pipeline(
+        "date_event",
+        lambda: data_extraction.DataExtractor.extract_json_from_URL(),
+        data_cleaning.DataCleaning.clean_date_events,
+        "dim_date_times",
+        (),
+        ["date_uuid"],
+    ),
+}
+
+
+def dependency_order(names):
+    """
+    Orders pipeline names so every pipeline comes after the pipelines it depends on.
+
+    Dependencies that are not among `names` are ignored, so 'order' can be run on its own
+    against dimension tables loaded earlier.
+
+    Args:
+        names (list of str): pipeline names, keys of PIPELINES
+
+    Raises:
+        ValueError: If the dependencies are circular.
+
+    Returns:
+        list of str: the names in dependency order, otherwise in their given order
+    """
+    ordered = []
+    remaining = list(dict.fromkeys(names))
+    while remaining:
+        ready = [
+            name
+            for name in remaining
+            if all(
+                dep in ordered or dep not in remaining
+                for dep in PIPELINES[name].depends_on
+            )
+        ]
+        if not ready:
+            raise ValueError(f"Circular pipeline dependencies between {remaining}")
+        ordered.extend(ready)
+        remaining = [name for name in remaining if name not in ready]
+    return ordered
+
+
+def profile_path(pipeline_name, stage):
+    """File the cProfile stats of a profiled stage are dumped to."""
+    return f"profile_{pipeline_name}_{stage}.prof"
+
+
+STAGES = ("extract", "clean", "load")
+
+
+def _run(
+    pipeline,
+    recorder,
+    call_clean,
+    before_load,
+    if_exists="fail",
+    compact=False,
+    profile_stage=None,
+    staging_area=None,
+    from_stage="extract",
+    dq_metrics=True,
+):
+    def profiled(stage):
+        return profile_path(pipeline.name, stage) if stage == profile_stage else None
+
+    if from_stage not in STAGES:
+        raise ValueError(f"from_stage must be one of {STAGES}, not '{from_stage}'")
+    if from_stage != "extract" and staging_area is None:
+        raise ValueError(f"Resuming from the {from_stage} stage needs a staging area")
+
+    quality = None
+    if from_stage == "load":
+        cleaned = recorder.time(
+            pipeline.name,
+            "restore",
+            lambda: staging_area.read("cleaned", pipeline.name),
+        )
+    else:
+        if from_stage == "clean":
+            data = recorder.time(
+                pipeline.name,
+                "restore",
+                lambda: staging_area.read("raw", pipeline.name),
+            )
+        else:
+            data = recorder.time(
+                pipeline.name,
+                "extract",
+                pipeline.extract,
+                profile_path=profiled("extract"),
+            )
+            if staging_area is not None:
+                recorder.time(
+                    pipeline.name,
+                    "stage",
+                    lambda: staging_area.write("raw", pipeline.name, data),
+                    rows=len(data),
+                )
+        # the quality profile is taken in the same call, on the cleaning's worker
+        (cleaned, quality), measurement = call_clean(
+            metrics.measure,
+            data_quality.clean_and_profile,
+            pipeline.clean,
+            data,
+            dq_metrics,
+            profile_path=profiled("clean"),
+        )
+        record = recorder.add(
+            pipeline.name, "clean", measurement, len(data), len(cleaned)
+        )
+        del data
+        if staging_area is not None:
+            recorder.time(
+                pipeline.name,
+                "stage",
+                lambda: staging_area.write("cleaned", pipeline.name, cleaned),
+                rows=len(cleaned),
+            )
+
+    if compact:
+        uncompacted = cleaned
+        cleaned = recorder.time(
+            pipeline.name,
+            "compact",
+            lambda: transformations.compact_dtypes(uncompacted),
+            rows_in=len(uncompacted),
+            profile_path=profiled("compact"),
+        )
+        report = transformations.memory_usage_report(uncompacted, cleaned)
+        print(f"{pipeline.table_name} memory use:\n{report}")
+        del uncompacted
+    before_load()
+    recorder.time(
+        pipeline.name,
+        "load",
+        lambda: schema.load(
+            pipeline.table_name, cleaned, if_exists=if_exists, key=pipeline.key
+        ),
+        rows_in=len(cleaned),
+        rows=len(cleaned),
+        profile_path=profiled("load"),
+    )
+    if quality is not None:
+        recorder.time(
+            pipeline.name,
+            "dq",
+            lambda: data_quality.write_metrics(
+                pipeline.table_name, quality, record.rows_in, record.dropped
+            ),
+        )
+
+
+def run_pipeline(name, recorder=None, **options):
+    """
+    Runs one extract -> clean -> load pipeline in the current process.
+
+    Args:
+        name (str): pipeline name, a key of PIPELINES
+        recorder (metrics.MetricsRecorder, optional): records every stage. Defaults to a new recorder.
+        if_exists (str, optional): passed to DatabaseConnector.upload_to_db, with the pipeline's
+            key. Defaults to "fail".
+        compact (bool, optional): run transformations.compact_dtypes on the cleaned frame
+            before loading it, recorded as a 'compact' stage. Defaults to False.
+        profile_stage (str, optional): stage to run under cProfile ('extract', 'clean',
+            'compact' or 'load'); the stats go to `profile_path(name, stage)`. Defaults to None.
+        staging_area (staging.StagingArea, optional): persist the raw extract and the cleaned
+            frame there. Defaults to None.
+        from_stage (str, optional): 'extract', or resume from the staged raw extract ('clean')
+            or the staged cleaned frame ('load'). Defaults to "extract".
+        dq_metrics (bool, optional): profile the cleaned frame while cleaning it and append
+            the profile to the dq_metrics table after the load, recorded as a 'dq' stage.
+            Not done when resuming from the load stage. Defaults to True.
+
+    Returns:
+        metrics.MetricsRecorder: the recorder
+    """
+    recorder = recorder or metrics.MetricsRecorder()
+    _run(
+        PIPELINES[name],
+        recorder,
+        lambda func, *args, **kwargs: func(*args, **kwargs),
+        lambda: None,
+        **options,
+    )
+    return recorder
+
+
+def run_pipelines(
+    names, max_threads=None, max_processes=None, recorder=None, **options
+):
+    """
+    Runs several extract -> clean -> load pipelines at the same time.
+
+    The cleaning workers are spawned, so they import the calling script again: its entry
+    point must be guarded by `if __name__ == "__main__"`, as in main.py.
+
+    Args:
+        names (list of str): pipeline names, keys of PIPELINES
+        max_threads (int, optional): threads for extraction and loading. Defaults to one per pipeline.
+        max_processes (int, optional): worker processes for cleaning, started with the spawn
+            method. Defaults to the number of CPUs.
+        recorder (metrics.MetricsRecorder, optional): records every stage. Defaults to a new recorder.
+        **options: if_exists, compact, profile_stage, staging_area, from_stage and dq_metrics, applied to
+            every pipeline, see `run_pipeline`.
+
+    Returns:
+        tuple: (metrics.MetricsRecorder with every completed stage,
+        dict mapping the name of each failed pipeline to its exception)
+    """
+    ordered = dependency_order(names)
+    recorder = recorder or metrics.MetricsRecorder()
+    errors = {}
+    loads = {}
+
+    def run(pipeline, processes):
+        def check_dependencies():
+            for dep in pipeline.depends_on:
+                if dep in loads and loads[dep].exception() is not None:
+                    raise RuntimeError(
+                        f"Not loading {pipeline.table_name}: the '{dep}' pipeline failed"
+                    )
+
+        _run(
+            pipeline,
+            recorder,
+            lambda func, *args, **kwargs: processes.submit(
+                func, *args, **kwargs
+            ).result(),
+            check_dependencies,
+            **options,
+        )
+
+    with ThreadPoolExecutor(max_workers=max_threads or len(ordered)) as threads:
+        # spawned, not forked: a fork of this multi-threaded process would copy locks held
+        # by other threads (the SQLAlchemy pool, the requests session) and could deadlock
+        with ProcessPoolExecutor(
+            max_workers=max_processes, mp_context=multiprocessing.get_context("spawn")
+        ) as processes:
+            # dependencies are submitted first, so a pipeline waiting on them never holds
+            # the only thread they could run on
+            for name in ordered:
+                loads[name] = threads.submit(run, PIPELINES[name], processes)
+            for name in ordered:
+                try:
+                    loads[name].result()
+                except Exception as error:
+                    errors[name] = error
+
+    return recorder, errors
@@ -0,0 +1,387 @@
+"""
+Declared column types, keys and indexes of the star schema.
+
+Left to itself, DataFrame.to_sql stores every object column as TEXT and creates no keys.
+Here each target table declares the types of its columns (UUID, VARCHAR, SMALLINT, DATE,
+NUMERIC), its primary key, its foreign keys and its indexes. `load` converts a cleaned
+frame to the declared types, bulk-loads it through a staging table of those types, so
+the database casts the values while copying them, and only then adds the keys and
+indexes, which is much faster than maintaining them row by row during the load.
+
+VARCHAR columns declared without a length are sized to their longest value. Columns that
+are not declared keep the types to_sql would give them.
+"""
+
+from collections import namedtuple
+
+import pandas as pd
+import sqlalchemy
+from sqlalchemy.dialects.postgresql import UUID
+
+import database_utils
+import transformations
+
+# columns: column -> SQLAlchemy type, foreign_keys: column -> referenced table (its primary
+# key), indexes: (columns, included columns) pairs
+TableSchema = namedtuple(
+    "TableSchema", ["columns", "primary_key", "foreign_keys", "indexes"]
+)
+
+SCHEMAS = {
+    "dim_users_table": TableSchema(
+        {
+            "first_name": sqlalchemy.VARCHAR(255),
+            "last_name": sqlalchemy.VARCHAR(255),
+            "date_of_birth": sqlalchemy.Date(),
+            "country_code": sqlalchemy.VARCHAR(),
+            "user_uuid": UUID(),
+            "join_date": sqlalchemy.Date(),
+        },
+        ["user_uuid"],
+        {},
+        [],
+    ),
+    "dim_cards": TableSchema(
+        {
+            "card_number": sqlalchemy.VARCHAR(),
+            "expiry_date": sqlalchemy.Date(),
+            "card_provider": sqlalchemy.VARCHAR(),
+            "date_payment_confirmed": sqlalchemy.Date(),
+        },
+        ["card_number"],
+        {},
+        [],
+    ),
+    "dim_stores": TableSchema(
+        {
+            "longitude": sqlalchemy.Numeric(),
+            "latitude": sqlalchemy.Numeric(),
+            "locality": sqlalchemy.VARCHAR(255),
+            "store_code": sqlalchemy.VARCHAR(),
+            "staff_numbers": sqlalchemy.SmallInteger(),
+            "opening_date": sqlalchemy.Date(),
+            "store_type": sqlalchemy.VARCHAR(255),
+            "country_code": sqlalchemy.VARCHAR(),
+            "continent": sqlalchemy.VARCHAR(255),
+        },
+        ["store_code"],
+        {},
+        [],
+    ),
+    "dim_products": TableSchema(
+        {
+            "product_price": sqlalchemy.Numeric(),
+            "EAN": sqlalchemy.VARCHAR(),
+            "product_code": sqlalchemy.VARCHAR(),
+            "date_added": sqlalchemy.Date(),
+            "uuid": UUID(),
+            "category": sqlalchemy.VARCHAR(),
+        },
+        ["product_code"],
+        {},
+        [],
+    ),
+    "dim_date_times": TableSchema(
+        {
+            "month": sqlalchemy.SmallInteger(),
+            "year": sqlalchemy.SmallInteger(),
+            "day": sqlalchemy.SmallInteger(),
+            "time_period": sqlalchemy.VARCHAR(),
+            "date_uuid": UUID(),
+        },
+        ["date_uuid"],
+        {},
+        [(("year", "month"), ())],
+    ),
+    "orders_table": TableSchema(
+        {
+            "date_uuid": UUID(),
+            "user_uuid": UUID(),
+            "card_number": sqlalchemy.VARCHAR(),
+            "store_code": sqlalchemy.VARCHAR(),
+            "product_code": sqlalchemy.VARCHAR(),
+            "product_quantity": sqlalchemy.SmallInteger(),
+        },
+        # every order has its own date event
+        ["date_uuid"],
+        {
+            "date_uuid": "dim_date_times",
+            "user_uuid": "dim_users_table",
+            "card_number": "dim_cards",
+            "store_code": "dim_stores",
+            "product_code": "dim_products",
+        },
+        # date_uuid covers the aggregate refreshes, which read the other keys and the quantity
+        [
+            (("date_uuid",), ("store_code", "product_code", "product_quantity")),
+            (("user_uuid",), ()),
+            (("card_number",), ()),
+            (("store_code",), ()),
+            (("product_code",), ()),
+        ],
+    ),
+}
+
+
+def index_name(table_name, columns):
+    """Name of the index on `columns`, shared with the indexes aggregates.py creates."""
+    return f"ix_{table_name}_{'_'.join(columns)}"
+
+
+def _to_number(series):
+    """Converts text such as '£32.56' or '1,024' to numbers. Other text becomes missing."""
+    numbers = pd.to_numeric(
+        series.astype(str).str.replace(r"[£$€,\s]", "", regex=True), errors="coerce"
+    )
+    return numbers.where(series.notna())
+
+
+# the spellings Postgres accepts for a UUID: 32 hex digits, optionally hyphenated and braced
+UUID_PATTERN = r"\{?[0-9a-fA-F]{8}(-?[0-9a-fA-F]{4}){3}-?[0-9a-fA-F]{12}\}?"
+
+
+def _to_uuid(series):
+    """Keeps the values that are UUIDs. Other values become missing."""
+    return series.where(series.astype(str).str.fullmatch(UUID_PATTERN))
+
+
+def prepare(table_name, df):
+    """
+    Converts a cleaned frame to its table's declared types.
+
+    Text in NUMERIC and integer columns is converted to numbers, integer columns become
+    nullable Int64 (so floats such as 12.0 are written as 12), text in DATE columns is
+    parsed as dates and text in UUID columns is checked to be UUIDs. Values that do not
+    convert are loaded as NULL; how many there were is printed.
+
+    Args:
+        table_name (str): target table, a key of SCHEMAS
+        df (pd.DataFrame): cleaned frame
+
+    Returns:
+        tuple: (converted frame, dict of column -> SQLAlchemy type for the declared columns
+        it has, with each VARCHAR sized to its longest value if it has no length)
+    """
+    table_schema = SCHEMAS.get(table_name)
+    if table_schema is None:
+        return df, {}
+    dtype = {}
+    converted = {}
+    for column, sql_type in table_schema.columns.items():
+        if column not in df.columns:
+            continue
+        series = df[column]
+        is_text = series.dtype == object or isinstance(
+            series.dtype, (pd.CategoricalDtype, pd.StringDtype)
+        )
+        if isinstance(sql_type, sqlalchemy.Integer):
+            if not pd.api.types.is_integer_dtype(series.dtype):
+                numbers = (
+                    _to_number(series)
+                    if is_text
+                    else pd.to_numeric(series, errors="coerce")
+                )
+                converted[column] = numbers.where(numbers % 1 == 0).astype("Int64")
+        elif isinstance(sql_type, sqlalchemy.Numeric) and is_text:
+            converted[column] = _to_number(series)
+        elif isinstance(sql_type, sqlalchemy.Date) and is_text:
+            converted[column], _ = transformations.parse_dates(series.astype(object))
+        elif isinstance(sql_type, UUID) and is_text:
+            converted[column] = _to_uuid(series)
+        if column in converted:
+            lost = int(converted[column].isna().sum() - series.isna().sum())
+            if lost:
+                print(
+                    f"{table_name}.{column}: {lost} values are not {sql_type} and are loaded as NULL"
+                )
+        if isinstance(sql_type, sqlalchemy.VARCHAR) and sql_type.length is None:
+            lengths = series.dropna().astype(str).str.len()
+            sql_type = sqlalchemy.VARCHAR(
+                max(int(lengths.max()), 1) if len(lengths) else 1
+            )
+        dtype[column] = sql_type
+    if converted:
+        df = df.assign(**converted)
+    return df, dtype
+
+
+def _try(connection, statement, failure):
+    """Runs a DDL statement in a savepoint. Prints `failure` and returns False if it fails."""
+    try:
+        with connection.begin_nested():
+            connection.execute(sqlalchemy.text(statement))
+        return True
+    except sqlalchemy.exc.DBAPIError as error:
+        print(f"{failure}: {str(error.orig).strip()}")
+        return False
+
+
+def add_constraints(connection, table_name):
+    """
+    Adds a loaded table's primary key and indexes, and the foreign keys between it and the other loaded tables.
+
+    Constraints that already exist are kept. A primary key that does not hold (duplicate
+    or NULL keys) is replaced by a plain index on its columns, and a foreign key whose
+    values are missing from the referenced table is left out, so later loads of the same
+    data do not fail on it. Either is printed.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): connection to the target database, in a transaction
+        table_name (str): the table just loaded
+    """
+    table_schema = SCHEMAS.get(table_name)
+    if table_schema is None:
+        return
+    inspector = sqlalchemy.inspect(connection)
+    quote = connection.dialect.identifier_preparer.quote
+
+    def column_list(columns):
+        return ", ".join(quote(column) for column in columns)
+
+    primary_key = table_schema.primary_key
+    if (
+        primary_key
+        and not inspector.get_pk_constraint(table_name)["constrained_columns"]
+    ):
+        unique_index = next(
+            (
+                index["name"]
+                for index in inspector.get_indexes(table_name)
+                if index["unique"] and index["column_names"] == list(primary_key)
+            ),
+            None,
+        )
+        # e.g. the unique index a merge load creates, promoted instead of built again
+        using = (
+            f"USING INDEX {quote(unique_index)}"
+            if unique_index
+            else f"({column_list(primary_key)})"
+        )
+        if not _try(
+            connection,
+            f"ALTER TABLE {quote(table_name)} ADD CONSTRAINT "
+            f"{quote(f'{table_name}_pkey')} PRIMARY KEY {using}",
+            f"No primary key on {table_name}",
+        ):
+            connection.execute(
+                sqlalchemy.text(
+                    f"CREATE INDEX IF NOT EXISTS {quote(index_name(table_name, primary_key))} "
+                    f"ON {quote(table_name)} ({column_list(primary_key)})"
+                )
+            )
+
+    for columns, include in table_schema.indexes:
+        include = f" INCLUDE ({column_list(include)})" if include else ""
+        connection.execute(
+            sqlalchemy.text(
+                f"CREATE INDEX IF NOT EXISTS {quote(index_name(table_name, columns))} "
+                f"ON {quote(table_name)} ({column_list(columns)}){include}"
+            )
+        )
+
+    # the table's own foreign keys, and those of the tables referencing it; a new
+    # inspector sees the primary key added above
+    inspector = sqlalchemy.inspect(connection)
+    for source, source_schema in SCHEMAS.items():
+        for column, referenced in source_schema.foreign_keys.items():
+            if table_name not in (source, referenced):
+                continue
+            if not (inspector.has_table(source) and inspector.has_table(referenced)):
+                continue
+            referenced_key = inspector.get_pk_constraint(referenced)[
+                "constrained_columns"
+            ]
+            existing = [
+                foreign_key
+                for foreign_key in inspector.get_foreign_keys(source)
+                if foreign_key["constrained_columns"] == [column]
+                and foreign_key["referred_table"] == referenced
+            ]
+            if not referenced_key or existing:
+                continue
+            _try(
+                connection,
+                f"ALTER TABLE {quote(source)} ADD CONSTRAINT "
+                f"{quote(f'fk_{source}_{column}')} FOREIGN KEY ({quote(column)}) "
+                f"REFERENCES {quote(referenced)} ({column_list(referenced_key)})",
+                f"No foreign key from {source}.{column} to {referenced}",
+            )
+
+
+def _widen_varchars(connection, table_name, dtype):
+    """Lengthens the VARCHAR columns of an existing table that the new values would not fit."""
+    quote = connection.dialect.identifier_preparer.quote
+    current = {
+        column["name"]: column["type"]
+        for column in sqlalchemy.inspect(connection).get_columns(table_name)
+    }
+    for column, sql_type in dtype.items():
+        existing = current.get(column)
+        if (
+            isinstance(sql_type, sqlalchemy.VARCHAR)
+            and isinstance(existing, sqlalchemy.VARCHAR)
+            and existing.length is not None
+            and existing.length < sql_type.length
+        ):
+            connection.execute(
+                sqlalchemy.text(
+                    f"ALTER TABLE {quote(table_name)} ALTER COLUMN {quote(column)} "
+                    f"TYPE VARCHAR({sql_type.length})"
+                )
+            )
+
+
+def constrain(table_name, db_connector=None):
+    """
+    Adds a loaded Postgres table's keys and indexes, see add_constraints.
+
+    Args:
+        table_name (str): the table loaded; nothing is done if it does not exist
+        db_connector (database_utils.DatabaseConnector, optional): Defaults to a new DatabaseConnector.
+    """
+    dc = db_connector or database_utils.DatabaseConnector()
+    engine = dc.init_db_engine(env="LOCAL")
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as connection:
+        if sqlalchemy.inspect(connection).has_table(table_name):
+            add_constraints(connection, table_name)
+
+
+def load(
+    table_name,
+    df,
+    if_exists="fail",
+    key=None,
+    db_connector=None,
+    constraints=True,
+):
+    """
+    Loads a cleaned frame with its table's declared types, then adds its keys and indexes.
+
+    A table loaded in chunks passes constraints=False for each chunk and calls
+    `constrain` once after the last one.
+
+    Args:
+        table_name (str): target table
+        df (pd.DataFrame): cleaned frame
+        if_exists (str, optional): see DatabaseConnector.upload_to_db. Defaults to "fail".
+        key (list of str, optional): key columns for 'merge'. Defaults to None.
+        db_connector (database_utils.DatabaseConnector, optional): Defaults to a new DatabaseConnector.
+        constraints (bool, optional): add the keys and indexes after the load. Defaults to True.
+
+    Returns:
+        the result of DatabaseConnector.upload_to_db
+    """
+    dc = db_connector or database_utils.DatabaseConnector()
+    df, dtype = prepare(table_name, df)
+    engine = dc.init_db_engine(env="LOCAL")
+    postgres = engine.dialect.name == "postgresql"
+    if postgres and if_exists in ("append", "merge"):
+        with engine.begin() as connection:
+            if sqlalchemy.inspect(connection).has_table(table_name):
+                _widen_varchars(connection, table_name, dtype)
+    result = dc.upload_to_db(table_name, df, if_exists=if_exists, key=key, dtype=dtype)
+    if constraints:
+        constrain(table_name, dc)
+    return result
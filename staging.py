@@ -0,0 +1,201 @@
+"""
+Staging area between the extract, clean and load stages.
+
+A pipeline run can persist its raw extract and its cleaned output, so a failed load is
+retried from the cleaned snapshot and the cleaning can be re-run offline against the raw
+one, without extracting again. Snapshots are laid out as
+
+    <root>/<layer>/<pipeline>/<snapshot id>/part-*.parquet   (cleaned)
+    <root>/<layer>/<pipeline>/<snapshot id>/frame.pkl        (raw)
+
+with layer 'raw' or 'cleaned'. Raw extracts are pickled, because Parquet would not give
+the cleaning back the frame the extract returned: object columns mixing types would
+become strings and NaN in text columns None. Cleaned tables are typed and stored as
+partitioned Parquet. A snapshot is written into a temporary directory that is renamed into
+place once complete, and a LATEST file naming the newest complete snapshot is then
+replaced atomically, so readers never see a half-written snapshot. The oldest snapshots
+beyond `keep` are deleted.
+"""
+
+import json
+import os
+import shutil
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+LAYERS = ("raw", "cleaned")
+# layers stored as a pickle of the frame rather than as Parquet, see the module docstring
+PICKLED_LAYERS = ("raw",)
+PICKLE_FILE = "frame.pkl"
+
+
+def parquet_compatible(df):
+    """
+    Returns the DataFrame with every column Parquet can store.
+
+    Parquet columns hold one type, so object columns mixing e.g. ints and strings are
+    converted to strings, missing values excepted. Other columns are left as they are.
+    """
+    converted = None
+    for column in df.columns:
+        if pd.api.types.infer_dtype(df[column]) in ("mixed", "mixed-integer"):
+            if converted is None:
+                converted = df.copy()
+            converted[column] = df[column].where(
+                df[column].isna(), df[column].astype(str)
+            )
+    return df if converted is None else converted
+
+
+class StagingArea:
+    """Snapshots of raw and cleaned pipeline frames, stored as a pickle and as partitioned Parquet."""
+
+    def __init__(self, root=".stage", keep=3, max_rows_per_file=1_000_000):
+        """
+        Args:
+            root (str, optional): Directory of the staging area. Defaults to ".stage".
+            keep (int, optional): Snapshots kept per pipeline and layer. Defaults to 3.
+            max_rows_per_file (int, optional): Rows per Parquet partition file. Defaults to 1000000.
+        """
+        self.root = root
+        self.keep = keep
+        self.max_rows_per_file = max_rows_per_file
+
+    def _directory(self, layer, name):
+        if layer not in LAYERS:
+            raise ValueError(
+                f"Unknown staging layer '{layer}', expected one of {LAYERS}"
+            )
+        return os.path.join(self.root, layer, name)
+
+    def latest(self, layer, name):
+        """Id of the newest complete snapshot, or None if there is none."""
+        try:
+            with open(os.path.join(self._directory(layer, name), "LATEST"), "r") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def snapshots(self, layer, name):
+        """Ids of the complete snapshots, oldest first."""
+        directory = self._directory(layer, name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            entry
+            for entry in os.listdir(directory)
+            if not entry.startswith((".", "LATEST"))
+            and os.path.isdir(os.path.join(directory, entry))
+        )
+
+    def write(self, layer, name, df):
+        """
+        Stores a frame as a new snapshot and makes it the latest.
+
+        Args:
+            layer (str): 'raw' or 'cleaned'
+            name (str): pipeline name
+            df (pd.DataFrame): frame to store
+
+        Returns:
+            str: the snapshot id
+        """
+        directory = self._directory(layer, name)
+        os.makedirs(directory, exist_ok=True)
+        # ids sort in write order: UTC time down to the nanosecond
+        now = time.time_ns()
+        snapshot = (
+            time.strftime("%Y%m%dT%H%M%S", time.gmtime(now // 10**9))
+            + f".{now % 10**9:09d}"
+        )
+        tmp_directory = os.path.join(directory, f".{snapshot}.part")
+
+        try:
+            if layer in PICKLED_LAYERS:
+                os.makedirs(tmp_directory)
+                df.to_pickle(os.path.join(tmp_directory, PICKLE_FILE))
+                file_format = "pickle"
+            else:
+                self._write_parquet(df, tmp_directory)
+                file_format = "parquet"
+            with open(os.path.join(tmp_directory, "_manifest.json"), "w") as f:
+                json.dump(
+                    {
+                        "rows": len(df),
+                        "columns": list(map(str, df.columns)),
+                        "format": file_format,
+                    },
+                    f,
+                )
+            os.replace(tmp_directory, os.path.join(directory, snapshot))
+        except BaseException:
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+            raise
+
+        tmp_latest = os.path.join(directory, f".LATEST.{uuid.uuid4().hex[:6]}")
+        with open(tmp_latest, "w") as f:
+            f.write(snapshot)
+        os.replace(tmp_latest, os.path.join(directory, "LATEST"))
+
+        for old in self.snapshots(layer, name)[: -self.keep]:
+            if old != snapshot:
+                shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+        return snapshot
+
+    def _write_parquet(self, df, directory):
+        table = pa.Table.from_pandas(parquet_compatible(df))
+        if table.num_rows:
+            ds.write_dataset(
+                table,
+                directory,
+                format="parquet",
+                basename_template="part-{i}.parquet",
+                max_rows_per_file=self.max_rows_per_file,
+                max_rows_per_group=min(self.max_rows_per_file, 128 * 1024),
+            )
+        else:
+            # write_dataset writes no file for an empty table, which would lose the schema
+            os.makedirs(directory)
+            pq.write_table(table, os.path.join(directory, "part-0.parquet"))
+
+    def read(self, layer, name, snapshot=None):
+        """
+        Reads a snapshot back into a DataFrame.
+
+        Args:
+            layer (str): 'raw' or 'cleaned'
+            name (str): pipeline name
+            snapshot (str, optional): snapshot id. Defaults to the latest.
+
+        Raises:
+            FileNotFoundError: If the pipeline has no snapshot in this layer.
+
+        Returns:
+            pd.DataFrame: the frame as written, with its dtypes and index. Raw snapshots give
+            back the exact frame; in cleaned ones, object columns mixing types are strings.
+        """
+        snapshot = snapshot or self.latest(layer, name)
+        if snapshot is None:
+            raise FileNotFoundError(
+                f"No {layer} snapshot of '{name}' in {self.root}, run its extract first"
+            )
+        path = os.path.join(self._directory(layer, name), snapshot)
+        if os.path.exists(os.path.join(path, PICKLE_FILE)):
+            return pd.read_pickle(os.path.join(path, PICKLE_FILE))
+        # partitions are read in order, so the rows come back in their written order
+        partitions = sorted(
+            (entry for entry in os.listdir(path) if entry.endswith(".parquet")),
+            key=lambda entry: int(entry[len("part-") : -len(".parquet")]),
+        )
+        return (
+            ds.dataset(
+                [os.path.join(path, entry) for entry in partitions], format="parquet"
+            )
+            .to_table()
+            .to_pandas()
+        )
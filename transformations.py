@@ -1,5 +1,10 @@
+import uuid
+
+import numpy as np
 import pandas as pd
 
+from metrics import counts_dropped_rows
+
 """Generalised transformation functions (independent of the table to clean). I found similar patterns across the tables. 
 """
 # unit test script for this/ error handling
@@ -15,11 +20,13 @@ def rows_without_atsymbol_email_address_locator(df):
     return df[~df["email_address"].str.contains("@")]
 
 
+@counts_dropped_rows
 def remove_rows_without_atsymbol_email_address(df):
     """transformation returns filtered df, with rows with no @ in email address removed."""
     return df[df["email_address"].str.contains("@")]
 
 
+@counts_dropped_rows
 def clean_user_data_rows_all_NULL(df):
     """Returns the transformed DataFrame. The transformation was dropping rows consisting entirely of the string 'NULL' as entries"""
     cleaned_df = df.drop(df[df.eq("NULL").all(axis=1)].index)
@@ -32,17 +39,9 @@ def is_upper_or_numeric(val):
 
     :param val: The parameter `val` is a variable that represents a value that we want to check if it is
     either uppercase or numeric
-    :return: a boolean value indicating whether the input value is either uppercase or numeric.
+    :return: a boolean value indicating whether the input value is either uppercase or numeric. Non-string
+    ints and floats (including NaN) count as numeric, any other type does not.
     """
-    return val.isupper() or val.isnumeric()
-
-
-def clean_upper_or_numeric_rows(df):
-    """Returns transformed DataFrame. The transformation was dropping rows consisting entirely of upper or numeric strings from the input"""
-    return df.drop(df[df.applymap(is_upper_or_numeric).all(axis=1)].index)
-
-
-def is_upper_or_numeric(val):
     if isinstance(val, str):
         return val.isupper() or val.isnumeric()
     elif isinstance(val, (int, float)):
@@ -51,6 +50,153 @@ def is_upper_or_numeric(val):
         return False
 
 
+def upper_or_numeric_mask(series):
+    """
+    Vectorised `is_upper_or_numeric` over a column.
+
+    Numeric columns are all True and datetime columns all False without looking at the values,
+    categoricals are checked once per category, and string columns go through the pandas
+    `.str` methods. Anything else falls back to `is_upper_or_numeric` per value.
+
+    Args:
+        series (pd.Series): column to check
+
+    Returns:
+        np.ndarray: boolean array, True where the value is upper case or numeric
+    """
+    kind = series.dtype.kind if isinstance(series.dtype, np.dtype) else None
+    if kind in ("b", "i", "u", "f"):
+        return np.ones(len(series), dtype=bool)
+    if kind in ("M", "m", "c"):
+        return np.zeros(len(series), dtype=bool)
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        category_mask = np.append(
+            series.cat.categories.map(is_upper_or_numeric).to_numpy(dtype=bool),
+            True,  # code -1 is a missing value, which applymap sees as NaN (a float)
+        )
+        return category_mask[series.cat.codes.to_numpy()]
+
+    if isinstance(series.dtype, pd.StringDtype):
+        return (
+            (series.str.isupper() | series.str.isnumeric())
+            .fillna(False)
+            .to_numpy(dtype=bool)
+        )
+
+    if kind == "O" and pd.api.types.infer_dtype(series, skipna=True) == "string":
+        values = series.to_numpy()
+        missing = pd.isna(values)
+        if not missing.any():
+            return (series.str.isupper() | series.str.isnumeric()).to_numpy(dtype=bool)
+        mask = np.empty(len(values), dtype=bool)
+        strings = series[~missing]
+        mask[~missing] = (strings.str.isupper() | strings.str.isnumeric()).to_numpy(
+            dtype=bool
+        )
+        mask[missing] = [is_upper_or_numeric(val) for val in values[missing]]
+        return mask
+
+    return series.map(is_upper_or_numeric).to_numpy(dtype=bool)
+
+
+def _upper_or_numeric_check_order(dtype):
+    """Sorts columns that decide rows cheaply (all False, then per category) ahead of string columns."""
+    if isinstance(dtype, np.dtype) and dtype.kind in ("M", "m", "c"):
+        return 0
+    if isinstance(dtype, pd.CategoricalDtype):
+        return 1
+    return 2
+
+
+def upper_or_numeric_rows_mask(df):
+    """
+    Boolean array, True for the rows of `df` consisting entirely of upper case or numeric values.
+
+    Same as `df.applymap(is_upper_or_numeric).all(axis=1)`, but checks column by column with
+    `upper_or_numeric_mask`, only looking at rows that every previous column let through and
+    stopping as soon as no row can match.
+    """
+    candidates = np.ones(len(df), dtype=bool)
+    columns = sorted(
+        range(df.shape[1]),
+        key=lambda i: _upper_or_numeric_check_order(df.dtypes.iloc[i]),
+    )
+    for i in columns:
+        if not candidates.any():
+            break
+        series = df.iloc[:, i]
+        if candidates.all():
+            candidates = upper_or_numeric_mask(series)
+        else:
+            positions = np.flatnonzero(candidates)
+            candidates[positions] = upper_or_numeric_mask(series.iloc[positions])
+    return candidates
+
+
+@counts_dropped_rows
+def clean_upper_or_numeric_rows(df):
+    """Returns transformed DataFrame. The transformation was dropping rows consisting entirely of upper or numeric strings from the input
+
+    Gives the same result as dropping the rows where `df.applymap(is_upper_or_numeric)` is all True, see
+    `upper_or_numeric_rows_mask`.
+    """
+    return df.drop(df.index[upper_or_numeric_rows_mask(df)])
+
+
+def upper_or_numeric_rows_expression(schema, columns=None):
+    """
+    Arrow dataset filter expression, True for the rows consisting entirely of upper case or numeric values.
+
+    The lazy counterpart of `upper_or_numeric_rows_mask`, for scanning pyarrow datasets with the
+    filter pushed down. It follows `is_upper_or_numeric` as the values arrive from pandas:
+    numeric columns are always True and temporal columns always False, missing strings are
+    False (None) and missing dictionary values True (a categorical's NaN).
+
+    Args:
+        schema (pyarrow.Schema): schema of the dataset
+        columns (list of str, optional): columns to check. Defaults to every column.
+
+    Returns:
+        pyarrow.compute.Expression: the filter
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    expression = pc.scalar(True)
+    for name in columns if columns is not None else schema.names:
+        field_type = schema.field(name).type
+        if pa.types.is_integer(field_type) or pa.types.is_floating(field_type):
+            continue
+        if pa.types.is_boolean(field_type) or pa.types.is_null(field_type):
+            continue
+        if pa.types.is_temporal(field_type):
+            return pc.scalar(False)
+        value = pc.field(name)
+        missing = pc.scalar(False)
+        if pa.types.is_dictionary(field_type):
+            value = value.cast(pa.string())
+            missing = pc.scalar(True)
+        elif not (
+            pa.types.is_string(field_type) or pa.types.is_large_string(field_type)
+        ):
+            raise TypeError(f"Cannot check column '{name}' of type {field_type} lazily")
+        expression = expression & pc.coalesce(
+            pc.utf8_is_upper(value) | pc.utf8_is_numeric(value), missing
+        )
+    return expression
+
+
+def notna_expression(columns):
+    """Arrow dataset filter expression, True for the rows with a value in every one of `columns` (`dropna(subset=columns)`)."""
+    import pyarrow.compute as pc
+
+    expression = pc.scalar(True)
+    for name in columns:
+        expression = expression & pc.field(name).is_valid()
+    return expression
+
+
 def remove_newline_character(series):
     """Removes newline character from a pd.Series (IE a column) and replaces it with a comma and a space. Primarily useful for cleaning address columns./
 
@@ -82,65 +228,422 @@ def clean_country_code_ggb(df):
     return df
 
 
+def _is_text(dtype):
+    """Whether a column of this dtype can hold strings; numeric, boolean and datetime columns cannot."""
+    return dtype == object or isinstance(dtype, pd.StringDtype)
+
+
+def arrow_strings(series):
+    """
+    The values of a text column as an Arrow string array, missing values as nulls.
+
+    Returns:
+        pyarrow.Array: the strings, or None if the column cannot hold strings or holds
+        anything else (numbers stored as objects, say)
+    """
+    import pyarrow as pa
+
+    if not _is_text(series.dtype):
+        return None
+    try:
+        return pa.array(series, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+
+
+def contains_mask(series, text, strings=None):
+    """
+    Boolean array, True for the values of a column that contain `text`.
+
+    Categoricals are checked once per category and columns that cannot hold strings are
+    all False without looking at the values. String columns are searched in Arrow, and
+    only the string values of mixed columns are checked one by one.
+
+    Args:
+        series (pd.Series): column to check
+        text (str): text to look for
+        strings (pyarrow.Array, optional): the column from `arrow_strings`, if the caller
+            has it already. Defaults to None.
+    """
+    import pyarrow.compute as pc
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = contains_mask(pd.Series(series.cat.categories), text)
+        codes = series.cat.codes.to_numpy()
+        return np.append(categories, False)[codes]  # code -1 (missing) takes the last
+    if not _is_text(series.dtype):
+        return np.zeros(len(series), dtype=bool)
+    strings = strings if strings is not None else arrow_strings(series)
+    if strings is not None:
+        found = pc.match_substring(strings, text).fill_null(False)
+        return found.to_numpy(zero_copy_only=False)
+    return np.fromiter(
+        (isinstance(value, str) and text in value for value in series.to_numpy()),
+        dtype=bool,
+        count=len(series),
+    )
+
+
+def equals_mask(series, value):
+    """Boolean array, True for the values of a column equal to the string `value`, checked like `contains_mask`."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories.to_numpy() == value
+        return np.append(categories, False)[series.cat.codes.to_numpy()]
+    if not _is_text(series.dtype):
+        return np.zeros(len(series), dtype=bool)
+    return series.eq(value).to_numpy(dtype=bool)
+
+
 def find_na_rows(df):
     """
     Returns all rows where any entry in any column is 'N/A'.
 
+    Each column is checked once with `contains_mask` instead of converting every row.
+
     Parameters:
     - df (pd.DataFrame): DataFrame to search
 
     Returns:
     - pd.DataFrame: DataFrame containing only the rows with 'N/A' in any column.
     """
-    return df[df.apply(lambda row: row.astype(str).str.contains("N/A").any(), axis=1)]
+    mask = np.zeros(len(df), dtype=bool)
+    for column in df.columns:
+        mask |= contains_mask(df[column], "N/A")
+    return df[mask]
 
 
+@counts_dropped_rows
 def drop_rows_with_invalid_card_numbers(df):
     return df[~df["card_number"].astype(str).str.contains("\?", regex=True)]
 
 
+# kilograms per unit, as (numerator, denominator) so gram and millilitre values are divided by 1000 exactly as before
+WEIGHT_UNIT_FACTORS = {
+    "kg": (1.0, 1.0),
+    "g": (1.0, 1000.0),
+    "ml": (1.0, 1000.0),
+    "oz": (0.0283495, 1.0),
+}
+
+# optional 'N x' multipack prefix, a quantity and a unit, e.g. '590g', '1.5kg', '16oz', '12 x 100g'
+WEIGHT_PATTERN = r"^\s*(?:(?P<multiplier>\d+(?:\.\d+)?)\s*x\s*)?(?P<quantity>\d+(?:\.\d+)?)\s*(?P<unit>[a-z]+)[\s,]*$"
+
+
+def parse_product_weights(series):
+    """
+    Parses a column of weight strings into kilograms in a single regex pass.
+
+    Each distinct entry is split into multiplier, quantity and unit with `str.extract`, and the unit is
+    converted to kilograms through `WEIGHT_UNIT_FACTORS`. Entries that cannot be parsed get a NaN
+    weight and a rejection reason.
+
+    Args:
+        series (pd.Series): raw weight strings, e.g. the products 'weight' column
+
+    Returns:
+        pd.DataFrame: same index as `series`, with columns 'multiplier', 'quantity', 'unit',
+        'weight_kg' and 'rejection_reason' (NaN for parsed entries)
+    """
+    # weights repeat a lot, so each distinct string is parsed once and the results mapped back
+    codes, uniques = pd.factorize(series)
+    entries = remove_newline_character(pd.Series(uniques, dtype=object).astype(str))
+    entries = entries.str.strip(".").str.lower()
+    parsed = entries.str.extract(WEIGHT_PATTERN)
+
+    multiplier = pd.to_numeric(parsed["multiplier"]).fillna(1.0)
+    quantity = pd.to_numeric(parsed["quantity"])
+    units = pd.DataFrame.from_dict(
+        WEIGHT_UNIT_FACTORS, orient="index", columns=["numerator", "denominator"]
+    )
+    factors = units.reindex(parsed["unit"]).set_axis(parsed.index)
+
+    rejection_reason = pd.Series(np.nan, index=parsed.index, dtype=object)
+    unknown_unit = parsed["unit"].notna() & factors["numerator"].isna()
+    rejection_reason[parsed["unit"].isna()] = "unrecognised format"
+    rejection_reason[unknown_unit] = (
+        "unknown unit '" + parsed["unit"][unknown_unit] + "'"
+    )
+
+    distinct = pd.DataFrame(
+        {
+            "multiplier": multiplier.where(quantity.notna()),
+            "quantity": quantity,
+            "unit": parsed["unit"],
+            "weight_kg": multiplier
+            * quantity
+            * factors["numerator"]
+            / factors["denominator"],
+            "rejection_reason": rejection_reason,
+        }
+    )
+    # code -1 marks a missing entry, which picks up the extra all-NaN row
+    distinct.loc[len(distinct)] = [np.nan, np.nan, np.nan, np.nan, "missing"]
+    result = distinct.take(np.where(codes == -1, len(distinct) - 1, codes))
+    return result.set_axis(series.index)
+
+
 def convert_product_weights(df_products):
-    def clean_g(gram_string):
-        return (
-            float(gram_string.replace("g", "")) / 1000
-        )  # logic to select strings with g but not x!
-
-    def clean_x_g(x_g_string):
-        """takes strings of the form : '5x60g' and returns 0.3 for 0.3kg"""
-
-        x_g_string = x_g_string.strip("g")
-        x_g_string = x_g_string.split("x")
-        result = float(x_g_string[0]) * float(x_g_string[1])
-        return result / 1000
-
-    def clean_ml(ml_string):
-        return float(ml_string.replace("ml", "")) / 1000
-
-    def clean_kg(kg_string):
-        return float(
-            kg_string.replace("kg", "")
-        )  # comes before clean_g: so as not to leave just k, for example.
-
-    def clean_oz(oz_string):
-        return float(oz_string.replace("oz", "")) * 0.0283495
-
-    def clean_weight_entry(entry):
-        entry = str(
-            entry
-        ).lower()  # Convert entry to string and make it lowercase for consistent matching
-        if "x" in entry and "g" in entry:
-            return clean_x_g(entry)
-        elif "kg" in entry:
-            return clean_kg(entry)
-        elif "g" in entry:
-            return clean_g(entry)
-        elif "ml" in entry:
-            return clean_ml(entry)
-        elif "oz" in entry:
-            return clean_oz(entry)
-        else:
-            return None  # Return None if the pattern doesn't match any of the known patterns
+    """
+    Converts the 'weight(KG)' column to kilograms in place, see `parse_product_weights`.
+
+    Parameters:
+    - df_products (pd.DataFrame): products DataFrame with a 'weight(KG)' column of raw weight strings
+
+    Returns:
+    - pd.DataFrame: the rejected entries, with the raw 'weight(KG)' value and a 'rejection_reason'
+    """
+    parsed = parse_product_weights(df_products["weight(KG)"])
+    rejected = parsed["rejection_reason"].notna()
+    rejections = pd.DataFrame(
+        {
+            "weight(KG)": df_products.loc[rejected, "weight(KG)"],
+            "rejection_reason": parsed.loc[rejected, "rejection_reason"],
+        }
+    )
+    df_products["weight(KG)"] = parsed["weight_kg"]
+    return rejections
+
+
+# explicit formats tried in order by `parse_dates`, the ones seen in legacy_users first
+DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%Y %B %d", "%B %Y %d")
+
+
+def _take_with_missing(values, codes, missing):
+    """Expands per-distinct-value results back to rows; code -1 (a missing input) gives `missing`."""
+    return np.append(values, missing)[codes]
+
+
+def parse_dates(series, formats=DATE_FORMATS):
+    """
+    Parses a column of date strings written in several formats.
+
+    Each distinct string is parsed once. The distinct strings are tried against each format
+    in turn, vectorised per format, and the strings no format matches fall back to pandas'
+    format inference.
+
+    Parameters:
+    - series (pd.Series): date strings
+    - formats (tuple of str): strptime formats, tried in order. Default DATE_FORMATS.
+
+    Returns:
+    - tuple: (pd.Series of datetime64[ns], NaT where the string could not be parsed,
+      pd.Series of the strings that could not be parsed, missing values excluded)
+    """
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return series, series.iloc[:0]
+    codes, uniques = pd.factorize(series)
+    uniques = pd.Series(uniques, dtype=object)
+    parsed = np.full(len(uniques), np.datetime64("NaT"), dtype="datetime64[ns]")
+    remaining = np.ones(len(uniques), dtype=bool)
+    for fmt in formats:
+        if not remaining.any():
+            break
+        positions = np.flatnonzero(remaining)
+        attempt = pd.to_datetime(uniques.iloc[positions], format=fmt, errors="coerce")
+        matched = attempt.notna().to_numpy()
+        parsed[positions[matched]] = attempt.to_numpy()[matched]
+        remaining[positions[matched]] = False
+    if remaining.any():
+        positions = np.flatnonzero(remaining)
+        attempt = pd.to_datetime(uniques.iloc[positions], errors="coerce")
+        parsed[positions] = attempt.to_numpy()
+    values = _take_with_missing(parsed, codes, np.datetime64("NaT"))
+    result = pd.Series(values, index=series.index, name=series.name)
+    return result, series[(codes != -1) & np.isnat(values)]
+
+
+def _dates_from_integers(year, month, day):
+    """datetime64[ns] dates from integer arrays by calendar arithmetic, NaT where a date does not exist."""
+    months = (year - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (
+        month - 1
+    ).astype("timedelta64[M]")
+    dates = months.astype("datetime64[D]") + (day - 1).astype("timedelta64[D]")
+    # a day past the end of its month rolls over into the next one; the year bounds keep
+    # the dates inside the datetime64[ns] range
+    valid = (
+        (year > 1677)
+        & (year < 2262)
+        & (month >= 1)
+        & (month <= 12)
+        & (day >= 1)
+        & (dates.astype("datetime64[M]") == months)
+    )
+    dates = dates.astype("datetime64[ns]")
+    dates[~valid] = np.datetime64("NaT")
+    return dates
+
+
+def _parse_times(times):
+    """timedelta64[ns] offsets from distinct time of day strings, NaT where unparsable."""
+    times = pd.Series(times, dtype=object)
+    offsets = np.full(len(times), np.timedelta64("NaT"), dtype="timedelta64[ns]")
+    fixed = times.str.fullmatch(r"\d\d:\d\d:\d\d").to_numpy(dtype=bool)
+    if fixed.any():
+        # 'HH:MM:SS' read straight from the bytes
+        digits = np.array(times[fixed].tolist(), dtype="S8").view(np.uint8).reshape(
+            -1, 8
+        ).astype(np.int64) - ord("0")
+        hours = digits[:, 0] * 10 + digits[:, 1]
+        minutes = digits[:, 3] * 10 + digits[:, 4]
+        seconds = digits[:, 6] * 10 + digits[:, 7]
+        fixed_offsets = ((hours * 60 + minutes) * 60 + seconds).astype("timedelta64[s]")
+        invalid = (hours > 23) | (minutes > 59) | (seconds > 59)
+        fixed_offsets[invalid] = np.timedelta64("NaT")
+        offsets[fixed] = fixed_offsets
+    if not fixed.all():
+        # other layouts ('9:05:00', fractional seconds...) go through the datetime parser
+        others = pd.to_datetime("1970-01-01 " + times[~fixed], errors="coerce")
+        offsets[~fixed] = (others - pd.Timestamp(0)).to_numpy()
+    return offsets
+
+
+def datetime_from_parts(year, month, day, time=None):
+    """
+    Builds datetimes from integer date components and an optional time of day.
+
+    The dates are assembled from the integers directly, without formatting them as strings;
+    each distinct time string ('HH:MM:SS') is parsed once.
+
+    Parameters:
+    - year, month, day (pd.Series): integer components
+    - time (pd.Series, optional): time of day strings, added to the dates
 
-    df_products["weight(KG)"] = remove_newline_character(df_products["weight(KG)"])
-    df_products["weight(KG)"] = df_products["weight(KG)"].str.strip(".")
-    df_products["weight(KG)"] = df_products["weight(KG)"].apply(clean_weight_entry)
+    Returns:
+    - tuple: (pd.Series of datetime64[ns], NaT where the row could not be parsed,
+      pd.DataFrame of the components of the rows that could not be parsed)
+    """
+    parts = pd.DataFrame({"year": year, "month": month, "day": day})
+    if all(pd.api.types.is_integer_dtype(parts[column]) for column in parts.columns):
+        values = _dates_from_integers(
+            year.to_numpy(np.int64), month.to_numpy(np.int64), day.to_numpy(np.int64)
+        )
+    else:
+        values = pd.to_datetime(parts, errors="coerce").to_numpy()
+    if time is not None:
+        codes, uniques = pd.factorize(time)
+        values = values + _take_with_missing(
+            _parse_times(uniques), codes, np.timedelta64("NaT")
+        )
+        parts["time"] = time
+    result = pd.Series(values, index=year.index)
+    return result, parts[np.isnat(values)]
+
+
+# identifier columns held as compact Arrow strings (or 16-byte values for UUIDs)
+UUID_COLUMNS = ("user_uuid", "date_uuid", "uuid")
+CODE_COLUMNS = ("card_number", "store_code", "product_code")
+# low-cardinality text columns held as categoricals
+CATEGORY_COLUMNS = (
+    "locality",
+    "store_type",
+    "card_provider",
+    "continent",
+    "time_period",
+    "country",
+    "country_code",
+    "category",
+)
+
+
+def uuids_to_binary(series):
+    """
+    Parses a column of UUID strings into fixed 16-byte Arrow values.
+
+    Args:
+        series (pd.Series): UUID strings
+
+    Raises:
+        ValueError: If a value is not a valid UUID.
+
+    Returns:
+        pd.Series: the UUIDs as 16 bytes each, missing values kept as missing
+    """
+    import pyarrow as pa
+
+    values = [None if pd.isna(val) else uuid.UUID(str(val)).bytes for val in series]
+    dtype = pd.ArrowDtype(pa.binary(16))
+    return pd.Series(
+        pd.array(pa.array(values, type=pa.binary(16)), dtype=dtype),
+        index=series.index,
+        name=series.name,
+    )
+
+
+def compact_dtypes(df, uuid_format="string", max_category_ratio=0.5):
+    """
+    Returns a copy of a cleaned DataFrame with compact dtypes.
+
+    - UUID_COLUMNS become Arrow strings, or 16-byte Arrow values with uuid_format="binary"
+      (columns holding anything that is not a UUID are left as strings)
+    - CODE_COLUMNS become Arrow strings
+    - CATEGORY_COLUMNS become categoricals, if they have at most max_category_ratio distinct values per row
+    - integer columns are downcast to the smallest integer type that holds their values
+    - float64 columns become float32 if every value converts exactly, so no precision is lost
+
+    Args:
+        df (pd.DataFrame): cleaned DataFrame
+        uuid_format (str): "string" or "binary". Default "string".
+        max_category_ratio (float): highest distinct-to-rows ratio converted to a categorical. Default 0.5.
+
+    Returns:
+        pd.DataFrame: compacted copy, see `memory_usage_report` to compare it with the input
+    """
+    df = df.copy()
+    for column in df.columns:
+        series = df[column]
+        if column in UUID_COLUMNS or column in CODE_COLUMNS:
+            if not isinstance(series.dtype, np.dtype) or series.dtype.kind != "O":
+                continue
+            if column in UUID_COLUMNS and uuid_format == "binary":
+                try:
+                    df[column] = uuids_to_binary(series)
+                    continue
+                except ValueError:
+                    pass
+            df[column] = series.astype("string[pyarrow]")
+        elif column in CATEGORY_COLUMNS:
+            if isinstance(series.dtype, pd.CategoricalDtype) or len(series) == 0:
+                continue
+            if series.nunique() / len(series) <= max_category_ratio:
+                df[column] = series.astype("category")
+        elif pd.api.types.is_integer_dtype(series.dtype) and isinstance(
+            series.dtype, np.dtype
+        ):
+            df[column] = pd.to_numeric(series, downcast="integer")
+        elif series.dtype == np.float64:
+            with np.errstate(over="ignore"):
+                downcast = series.astype(np.float32)
+            if np.array_equal(
+                downcast.to_numpy(np.float64), series.to_numpy(), equal_nan=True
+            ):
+                df[column] = downcast
+    return df
+
+
+def memory_usage_report(before, after):
+    """
+    Compares the memory used by each column of a DataFrame before and after compaction.
+
+    Args:
+        before (pd.DataFrame): original DataFrame
+        after (pd.DataFrame): compacted DataFrame, with the same columns
+
+    Returns:
+        pd.DataFrame: one row per column plus a 'total' row, with the dtypes and bytes before and after
+    """
+    report = pd.DataFrame(
+        {
+            "dtype_before": before.dtypes.astype(str),
+            "dtype_after": after.dtypes.astype(str),
+            "bytes_before": before.memory_usage(deep=True, index=False),
+            "bytes_after": after.memory_usage(deep=True, index=False),
+        }
+    )
+    report.loc["total"] = [
+        "",
+        "",
+        report["bytes_before"].sum(),
+        report["bytes_after"].sum(),
+    ]
+    report["saved"] = 1 - report["bytes_after"] / report["bytes_before"]
+    return report